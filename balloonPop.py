@@ -1,15 +1,60 @@
 import pygame
-import random
+import numpy as np
 import math
 import os
+import sys
 import json
 import uuid
+import bisect
+import copy
+import struct
+import hashlib
+import sqlite3
+import time
+import queue
+import threading
+import tempfile
+from collections import OrderedDict, deque
+from contextlib import nullcontext
 from datetime import datetime
+from fractions import Fraction
 
+MIXER_BUFFER = 512  # Samples per mixer buffer; small for low-latency pops
+pygame.mixer.pre_init(44100, -16, 2, MIXER_BUFFER)
 pygame.init()
 
 # Game constants
-WIDTH, HEIGHT = 800, 700
+# Laid out for an 800x700 window but drawn at RENDER_SCALE times that; px() scales a length
+DESIGN_WIDTH, DESIGN_HEIGHT = 800, 700
+MIN_RENDER_SCALE, MAX_RENDER_SCALE = 0.25, 4.0
+
+def render_scale(text):
+    scale = float(text)
+    if not MIN_RENDER_SCALE <= scale <= MAX_RENDER_SCALE:
+        raise ValueError(f"render scale must be between {MIN_RENDER_SCALE:g} and {MAX_RENDER_SCALE:g}")
+    return scale
+
+def _startup_render_scale():
+    scale = os.environ.get("BALLOONPOP_RENDER_SCALE", "1")
+    if __name__ == "__main__":
+        import argparse
+        early = argparse.ArgumentParser(add_help=False)
+        early.add_argument("--render-scale", default=scale)
+        scale = early.parse_known_args()[0].render_scale
+        try:
+            return render_scale(scale)
+        except ValueError:
+            return 1.0  # The full command line parser reports it
+    return render_scale(scale)
+
+RENDER_SCALE = _startup_render_scale()
+
+def px(length):
+    # A design-size length in internal pixels; never rounds down to nothing
+    return max(1, round(length * RENDER_SCALE))
+
+WIDTH, HEIGHT = px(DESIGN_WIDTH), px(DESIGN_HEIGHT)
+HEADER_HEIGHT = px(60)
 WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
 RED = (255, 0, 0)
@@ -17,30 +62,353 @@ BLUE = (0, 0, 255)
 GREEN = (0, 255, 0)
 GRAY = (200, 200, 200)
 DARK_GRAY = (100, 100, 100)
-FONT_SMALL = pygame.font.SysFont("Arial", 24, bold=True)
-FONT_MEDIUM = pygame.font.SysFont("Arial", 32, bold=True)
-FONT_LARGE = pygame.font.SysFont("Arial", 48, bold=True)
-
-# Load sounds
-try:
-    pop_sound = pygame.mixer.Sound('pop.wav.mp3')
-    background_music = pygame.mixer.Sound('background.wav.mp3')
-    menu_music = pygame.mixer.Sound('menu.wav.mp3')
-    has_sound = True
-except:
-    print("Sound files not found. Continuing without sound.")
-    has_sound = False
-
-# Load or create background
-try:
-    sky_image = pygame.image.load('sky_background.jpg')
-    sky_image = pygame.transform.scale(sky_image, (WIDTH, HEIGHT))
-except:
-    sky_image = pygame.Surface((WIDTH, HEIGHT))
-    sky_image.fill((135, 206, 235))  # Sky blue fallback
-
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Balloon Pop")
+FONT_SMALL = pygame.font.SysFont("Arial", px(24), bold=True)
+FONT_MEDIUM = pygame.font.SysFont("Arial", px(32), bold=True)
+FONT_LARGE = pygame.font.SysFont("Arial", px(48), bold=True)
+
+# Assets
+class AssetManager:
+    """Loads images and sounds on a background thread, with a disk cache of decoded assets."""
+
+    def __init__(self, cache_dir='.asset_cache'):
+        self.started = time.perf_counter()
+        self.cache_dir = cache_dir
+        self.images = {}
+        self.sounds = {}
+        self.jobs = []
+        self.done = queue.Queue()
+        self.pending = 0
+        self.thread = None
+        self.first_frame_ms = None
+        self.ready_ms = None
+
+    def add_image(self, name, path, size, placeholder_color):
+        placeholder = pygame.Surface(size)
+        placeholder.fill(placeholder_color)
+        self.images[name] = placeholder
+        self.jobs.append(("image", name, path, size))
+        self.pending += 1
+
+    def add_sound(self, name, path):
+        self.sounds[name] = None
+        if pygame.mixer.get_init():
+            self.jobs.append(("sound", name, path, None))
+            self.pending += 1
+
+    def image(self, name):
+        return self.images[name]
+
+    def sound(self, name):
+        return self.sounds.get(name)
+
+    def start(self):
+        # Jobs run in the order they were added, so add what's needed first first
+        self.thread = threading.Thread(target=self.load_all, name="asset-loader", daemon=True)
+        self.thread.start()
+
+    def load_all(self):
+        jobs, self.jobs = self.jobs, []
+        for kind, name, path, size in jobs:
+            try:
+                asset = self._load_image(path, size) if kind == "image" else self._load_sound(path)
+            except (pygame.error, OSError) as error:
+                print(f"Could not load {path} ({error}). Continuing without it.")
+                asset = None
+            self.done.put((kind, name, asset))
+
+    def _cache_path(self, path, *key):
+        stat = os.stat(path)
+        tag = "-".join(str(part) for part in (stat.st_mtime_ns, stat.st_size) + key)
+        return os.path.join(self.cache_dir, f"{os.path.basename(path)}.{tag}.raw")
+
+    @staticmethod
+    def _cache_variant(entry):
+        # (source file name, key) of a cache entry, leaving out the source
+        # version; None for anything else in the directory
+        if not entry.endswith(".raw") or "." not in entry[:-4]:
+            return None
+        name, tag = entry[:-4].rsplit(".", 1)
+        parts = tag.split("-", 2)  # Versions are never negative; keys can be
+        return (name, parts[2] if len(parts) == 3 else "")
+
+    def _read_cache(self, cache_path):
+        try:
+            with open(cache_path, 'rb') as file:
+                return file.read()
+        except OSError:
+            return None
+
+    def _write_cache(self, cache_path, data):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Drop entries for older versions of the same source file at the
+            # same size (or mixer format); other sizes stay for other scales
+            current = os.path.basename(cache_path)
+            variant = self._cache_variant(current)
+            for entry in os.listdir(self.cache_dir):
+                if entry != current and self._cache_variant(entry) == variant:
+                    try:
+                        os.remove(os.path.join(self.cache_dir, entry))
+                    except FileNotFoundError:
+                        pass  # Another process got there first
+            # A uniquely named temp file, so processes warming the cache at
+            # once never write into each other's half-finished file
+            file = tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix=".tmp", delete=False)
+            try:
+                with file:
+                    file.write(data)
+                os.replace(file.name, cache_path)
+            except OSError:
+                os.remove(file.name)
+                raise
+        except OSError:
+            pass  # The cache only speeds up the next start
+
+    def _load_image(self, path, size):
+        cache_path = self._cache_path(path, *size)
+        data = self._read_cache(cache_path)
+        if data is not None and len(data) == size[0] * size[1] * 3:
+            return pygame.image.frombytes(data, size, "RGB")
+        image = pygame.transform.scale(pygame.image.load(path), size)
+        self._write_cache(cache_path, pygame.image.tobytes(image, "RGB"))
+        return image
+
+    def _load_sound(self, path):
+        cache_path = self._cache_path(path, *pygame.mixer.get_init())
+        data = self._read_cache(cache_path)
+        if data is not None:
+            return pygame.mixer.Sound(buffer=data)
+        sound = pygame.mixer.Sound(path)
+        self._write_cache(cache_path, sound.get_raw())
+        return sound
+
+    def poll(self):
+        # Main thread only: installs finished assets; True if any arrived
+        arrived = False
+        while True:
+            try:
+                kind, name, asset = self.done.get_nowait()
+            except queue.Empty:
+                break
+            self.pending -= 1
+            arrived = True
+            if asset is None:
+                continue
+            if kind == "image":
+                if pygame.display.get_surface() is not None:
+                    asset = asset.convert()
+                self.images[name] = asset
+                renderer.invalidate()  # Cached layers were built from the placeholder
+            else:
+                self.sounds[name] = asset
+        if self.pending == 0 and self.ready_ms is None:
+            self.ready_ms = (time.perf_counter() - self.started) * 1000
+        return arrived
+
+    def wait(self):
+        # Load everything now, on this thread (tools and benchmarks)
+        if self.thread is not None:
+            self.thread.join()
+        self.load_all()
+        self.poll()
+
+    def first_frame(self):
+        if self.first_frame_ms is None:
+            self.first_frame_ms = (time.perf_counter() - self.started) * 1000
+
+    def report(self):
+        return {"first_frame_ms": self.first_frame_ms, "assets_ready_ms": self.ready_ms,
+                "pending": self.pending}
+
+assets = AssetManager()
+assets.add_image("sky", 'sky_background.jpg', (WIDTH, HEIGHT), (135, 206, 235))  # Sky blue until loaded
+assets.add_sound("pop", 'pop.wav.mp3')
+has_sound = pygame.mixer.get_init() is not None
+
+# Audio
+class AudioManager:
+    """Streams music from disk and plays sound effects on a reserved channel pool."""
+    MUSIC = {"menu": ('menu.wav.mp3', 0.5), "game": ('background.wav.mp3', 0.3)}
+    FADE_MS = 400
+    SFX_CHANNELS = 8
+    MAX_SFX_PER_FRAME = 4
+
+    def __init__(self):
+        self.enabled = pygame.mixer.get_init() is not None
+        self.track = None  # Track currently loaded into the music stream
+        self.target = None  # Track that should be playing
+        self.volume = 0.0
+        self.duck = 1.0  # Music volume multiplier, lowered while paused
+        self.channels = []
+        self.started = []
+        self.started_this_frame = 0
+        self.stolen = 0
+        self.dropped = 0
+        if self.enabled:
+            pygame.mixer.set_num_channels(self.SFX_CHANNELS * 2)
+            pygame.mixer.set_reserved(self.SFX_CHANNELS)
+            self.channels = [pygame.mixer.Channel(i) for i in range(self.SFX_CHANNELS)]
+            self.started = [0.0] * self.SFX_CHANNELS
+
+    def play_music(self, track):
+        self.target = track
+
+    def duck_music(self, ducked):
+        self.duck = 0.33 if ducked else 1.0
+
+    def update(self, frame_time):
+        # Once per frame: advances music fades and resets the SFX rate limit
+        self.started_this_frame = 0
+        if not self.enabled:
+            return
+        step = frame_time / self.FADE_MS
+        if self.track != self.target:
+            self.volume = max(0.0, self.volume - step)
+            if self.volume == 0.0 or self.track is None:
+                self._switch(self.target)
+        else:
+            target_volume = self.MUSIC[self.track][1] * self.duck if self.track else 0.0
+            if self.volume < target_volume:
+                self.volume = min(target_volume, self.volume + step)
+            else:
+                self.volume = max(target_volume, self.volume - step)
+        if self.track is not None:
+            pygame.mixer.music.set_volume(self.volume)
+
+    def _switch(self, track):
+        pygame.mixer.music.stop()
+        self.track = track
+        self.volume = 0.0
+        if track is None:
+            return
+        try:
+            pygame.mixer.music.load(self.MUSIC[track][0])
+            pygame.mixer.music.set_volume(0.0)
+            pygame.mixer.music.play(-1)  # -1 means loop indefinitely
+        except pygame.error as error:
+            print(f"Could not play {track} music ({error}). Continuing without it.")
+
+    def play_sfx(self, sound):
+        if not self.enabled or sound is None:
+            return
+        if self.started_this_frame >= self.MAX_SFX_PER_FRAME:
+            self.dropped += 1
+            return
+        self.started_this_frame += 1
+        now = time.perf_counter()
+        for i, channel in enumerate(self.channels):
+            if not channel.get_busy():
+                break
+        else:
+            i = self.started.index(min(self.started))  # Steal the oldest voice
+            self.stolen += 1
+        self.channels[i].play(sound)
+        self.started[i] = now
+
+    def metrics(self):
+        if not self.enabled:
+            return {"enabled": False}
+        frequency, size, channels = pygame.mixer.get_init()
+        # Every loaded effect is held decoded, whether it has played yet or not
+        samples = sum(int(sound.get_length() * frequency) for sound in assets.sounds.values() if sound is not None)
+        return {
+            "enabled": True,
+            "music_track": self.track,
+            "music_streamed": True,
+            "sfx_decoded_bytes": samples * abs(size) // 8 * channels,
+            "sfx_voices_busy": sum(channel.get_busy() for channel in self.channels),
+            "sfx_voices_stolen": self.stolen,
+            "sfx_dropped": self.dropped,
+            "buffer_latency_ms": MIXER_BUFFER / frequency * 1000
+        }
+
+audio = AudioManager()
+
+# The window is opened by init_display(); game logic never needs it. The game
+# draws to screen, at the internal resolution, and viewport shows it.
+screen = None
+
+class Viewport:
+    """Shows the internal-resolution screen in a window of any size."""
+
+    def __init__(self):
+        self.window = None
+        self.view = None  # Where screen appears in the window, when scaled in software
+        self.target = None  # The window's view area
+        self.block = (1, 1)  # Screen pixels per whole block, per axis
+        self.view_block = (1, 1)  # The same blocks in window pixels
+
+    def open(self, window_size=None, scaled=False, fullscreen=False, vsync=False):
+        global screen
+        flags = pygame.FULLSCREEN if fullscreen else 0
+        self.view = self.target = None
+        if scaled or vsync:
+            try:
+                screen = self.window = pygame.display.set_mode((WIDTH, HEIGHT), flags | pygame.SCALED,
+                                                               vsync=int(vsync))
+                return screen
+            except pygame.error as error:
+                print(f"Could not open a scaled window ({error}). Scaling in software instead.")
+        size = (0, 0) if fullscreen else window_size or (DESIGN_WIDTH, DESIGN_HEIGHT)
+        self.window = pygame.display.set_mode(size, flags)
+        window_width, window_height = self.window.get_size()
+        if (window_width, window_height) == (WIDTH, HEIGHT):
+            screen = self.window
+            return screen
+        fit = min(Fraction(window_width, WIDTH), Fraction(window_height, HEIGHT))
+        fit = max(Fraction(math.floor(fit * denominator), denominator) for denominator in range(1, 9)) or fit
+        view_size = (max(1, round(WIDTH * fit)), max(1, round(HEIGHT * fit)))
+        self.view = pygame.Rect(((window_width - view_size[0]) // 2, (window_height - view_size[1]) // 2), view_size)
+        self.target = self.window.subsurface(self.view)
+        blocks = (math.gcd(WIDTH, view_size[0]), math.gcd(HEIGHT, view_size[1]))
+        self.block = (WIDTH // blocks[0], HEIGHT // blocks[1])
+        self.view_block = (view_size[0] // blocks[0], view_size[1] // blocks[1])
+        self.window.fill(BLACK)
+        screen = pygame.Surface((WIDTH, HEIGHT)).convert()
+        return screen
+
+    def flip(self):
+        if self.view is not None:
+            pygame.transform.scale(screen, self.view.size, self.target)
+        pygame.display.flip()
+
+    def update(self, rects):
+        if self.view is None:
+            pygame.display.update(rects)
+            return
+        (block_width, block_height), (view_width, view_height) = self.block, self.view_block
+        shown = []
+        for rect in rects:
+            rect = rect.clip(screen.get_rect())
+            if not rect:
+                continue
+            left, top = rect.left // block_width, rect.top // block_height
+            columns = -(-rect.right // block_width) - left
+            rows = -(-rect.bottom // block_height) - top
+            target = pygame.Rect(left * view_width, top * view_height, columns * view_width, rows * view_height)
+            source = pygame.Rect(left * block_width, top * block_height, columns * block_width, rows * block_height)
+            pygame.transform.scale(screen.subsurface(source), target.size, self.target.subsurface(target))
+            shown.append(target.move(self.view.topleft))
+        pygame.display.update(shown)
+
+    def to_game(self, events):
+        # Maps window mouse positions to screen positions, in place
+        if self.view is None:
+            return events
+        view = self.view
+        for event in events:
+            if event.type in (pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP):
+                x, y = event.pos
+                event.pos = (min(max((x - view.x) * WIDTH // view.width, 0), WIDTH - 1),
+                             min(max((y - view.y) * HEIGHT // view.height, 0), HEIGHT - 1))
+        return events
+
+viewport = Viewport()
+
+def init_display(window_size=None, scaled=False, fullscreen=False, vsync=False):
+    viewport.open(window_size, scaled, fullscreen, vsync)
+    pygame.display.set_caption("Balloon Pop")
+    return screen
 
 # Game colors and settings
 BALLOON_COLORS = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0), (255, 165, 0), (75, 0, 130)]
@@ -50,54 +418,254 @@ DIFFICULTIES = {
     "hard": {"min_speed": 3, "max_speed": 7, "speed_increase": 1.5}
 }
 
+# Score storage
+# Stores offer add(entry), top(limit, difficulty=None), rank(score, difficulty=None) and count();
+# poll() returns how many scores were saved in the background since the last call
+SCORE_FIELDS = ("player_id", "name", "score", "level", "difficulty", "timestamp")
+BUSY_TIMEOUT_MS = 5000  # How long to wait for another process's write to finish
+
+class ScoreWriter:
+    """Saves scores to an SQLite database on its own thread, off the game loop."""
+    RETRY_DELAYS = (0.1, 0.5, 2.0, 10.0)  # Seconds before each retry; the last repeats
+    CLOSE_ATTEMPTS = 3
+
+    def __init__(self, path):
+        self.path = path
+        self.jobs = queue.Queue()
+        self.done = queue.Queue()  # (saved, error or None, given up on)
+        self.thread = threading.Thread(target=self.run, name="score-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, entries):
+        self.jobs.put(list(entries))
+
+    def _collect(self, entries, timeout):
+        # Adds queued scores to entries, waiting up to timeout (None: for
+        # ever) for the first batch; True once close() has been called
+        try:
+            job = self.jobs.get(timeout=timeout)
+        except queue.Empty:
+            return False
+        while job is not None:
+            entries.extend(job)
+            try:
+                job = self.jobs.get_nowait()
+            except queue.Empty:
+                return False
+        return True
+
+    def run(self):
+        db = sqlite3.connect(self.path)
+        db.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        db.execute("PRAGMA synchronous = FULL")
+        entries = []  # Not saved yet, including those from failed attempts
+        failures = 0
+        attempts_left = None  # Counted down once close() is waiting
+        while True:
+            delay = self.RETRY_DELAYS[min(failures, len(self.RETRY_DELAYS)) - 1] if failures else None
+            if attempts_left is None:
+                if self._collect(entries, delay):
+                    attempts_left = self.CLOSE_ATTEMPTS
+            elif failures:
+                time.sleep(self.RETRY_DELAYS[0])
+            if not entries:
+                if attempts_left is not None:
+                    break
+                continue
+            try:
+                with db:
+                    SqliteScoreStore._insert(db, entries)
+            except sqlite3.Error as error:
+                failures += 1
+                if attempts_left is not None:
+                    attempts_left -= 1
+                    if attempts_left == 0:
+                        self.done.put((0, error, len(entries)))
+                        break
+                if failures == 1:
+                    self.done.put((0, error, 0))  # Reported once; retried until it works
+                continue
+            self.done.put((len(entries), None, 0))
+            entries = []
+            failures = 0
+        db.close()
+
+    def close(self):
+        # Waits for everything queued so far to be written
+        self.jobs.put(None)
+        self.thread.join()
+
+class SqliteScoreStore:
+    """Default score store: an SQLite file in WAL mode, seeded once from scores.json."""
+
+    def __init__(self, path='scores.db', legacy_json='scores.json', background=False):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        with self.db:
+            self.db.executescript("""
+                CREATE TABLE IF NOT EXISTS scores (
+                    id INTEGER PRIMARY KEY,
+                    player_id TEXT, name TEXT, score INTEGER, level INTEGER,
+                    difficulty TEXT, timestamp TEXT);
+                CREATE INDEX IF NOT EXISTS scores_by_score ON scores (score DESC, id);
+                CREATE INDEX IF NOT EXISTS scores_by_difficulty ON scores (difficulty, score DESC, id);
+                CREATE TABLE IF NOT EXISTS score_counts (
+                    difficulty TEXT, score INTEGER, count INTEGER,
+                    PRIMARY KEY (difficulty, score)) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS score_counts_by_score ON score_counts (score, count);
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            """)
+        if legacy_json and path != ':memory:':
+            self.migrate_json(legacy_json)
+        self.writer = ScoreWriter(path) if background and path != ':memory:' else None
+
+    def migrate_json(self, json_path):
+        if self.db.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+            return
+        scores = []
+        if os.path.exists(json_path):
+            try:
+                with open(json_path, 'r') as file:
+                    scores = json.load(file)
+            except (json.JSONDecodeError, IOError):
+                print(f"Could not read {json_path}; old scores were not imported.")
+        # Checked again under the write lock, so only one of several starting processes imports;
+        # the file is best first with ties in play order, which inserting in order keeps
+        with self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            if self.db.execute("INSERT OR IGNORE INTO meta VALUES ('json_migrated', ?)", (json_path,)).rowcount:
+                self._insert(self.db, scores)
+
+    @staticmethod
+    def _insert(db, entries):
+        rows = [(entry.get('player_id'), entry.get('name', 'Anonymous'), entry['score'],
+                 entry.get('level', 1), entry.get('difficulty', 'medium'), entry.get('timestamp'))
+                for entry in entries]
+        db.executemany("INSERT INTO scores (player_id, name, score, level, difficulty, timestamp) "
+                       "VALUES (?, ?, ?, ?, ?, ?)", rows)
+        db.executemany("INSERT INTO score_counts VALUES (?, ?, 1) "
+                       "ON CONFLICT (difficulty, score) DO UPDATE SET count = count + 1",
+                       [(row[4], row[2]) for row in rows])
+
+    def add(self, entry):
+        self.add_many([entry])
+
+    def add_many(self, entries):
+        if self.writer is not None:
+            self.writer.submit(entries)
+            return
+        with self.db:
+            self._insert(self.db, entries)
+
+    def poll(self):
+        saved = 0
+        if self.writer is not None:
+            while not self.writer.done.empty():
+                count, error, lost = self.writer.done.get_nowait()
+                if lost:
+                    print(f"Could not save scores ({error}); gave up on {lost}.")
+                elif error is not None:
+                    print(f"Could not save scores yet ({error}); retrying.")
+                saved += count
+        return saved
+
+    def top(self, limit=10, difficulty=None):
+        columns = ", ".join(SCORE_FIELDS)
+        if difficulty is None:
+            rows = self.db.execute(f"SELECT {columns} FROM scores ORDER BY score DESC, id LIMIT ?", (limit,))
+        else:
+            rows = self.db.execute(f"SELECT {columns} FROM scores WHERE difficulty = ? "
+                                   "ORDER BY score DESC, id LIMIT ?", (difficulty, limit))
+        return [dict(zip(SCORE_FIELDS, row)) for row in rows]
+
+    def rank(self, score, difficulty=None):
+        if difficulty is None:
+            row = self.db.execute("SELECT SUM(count) FROM score_counts WHERE score > ?", (score,))
+        else:
+            row = self.db.execute("SELECT SUM(count) FROM score_counts WHERE difficulty = ? AND score > ?",
+                                  (difficulty, score))
+        return (row.fetchone()[0] or 0) + 1
+
+    def count(self):
+        return self.db.execute("SELECT SUM(count) FROM score_counts").fetchone()[0] or 0
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.poll()
+        self.db.close()
+
+class MemoryScoreStore:
+    """In-memory score store for simulations and benchmarks; nothing is persisted."""
+
+    def __init__(self):
+        self.entries = []
+        self.keys = {}  # difficulty (None for all) -> ascending list of scores
+
+    def add(self, entry):
+        self.add_many([entry])
+
+    def add_many(self, entries):
+        for entry in entries:
+            self.entries.append(dict(entry))
+            for difficulty in (None, entry['difficulty']):
+                bisect.insort(self.keys.setdefault(difficulty, []), entry['score'])
+
+    def top(self, limit=10, difficulty=None):
+        entries = [entry for entry in self.entries if difficulty in (None, entry['difficulty'])]
+        return sorted(entries, key=lambda x: x["score"], reverse=True)[:limit]
+
+    def rank(self, score, difficulty=None):
+        keys = self.keys.get(difficulty, [])
+        return len(keys) - bisect.bisect_right(keys, score) + 1
+
+    def count(self):
+        return len(self.entries)
+
+    def poll(self):
+        return 0
+
 # Game state
 class GameState:
-    def __init__(self):
+    def __init__(self, seed=None, score_store=None):
+        self.rng = np.random.default_rng(seed)
+        self.score_store = SqliteScoreStore(background=True) if score_store is None else score_store
+        self.sound_enabled = has_sound
         self.reset()
-        self.scores = []
+        self.scores = []  # Top ten, best first, for the high score table
         self.player_name = ""
         self.name_input_active = False
         self.load_scores()
         self.music_playing = None
+        self.custom_difficulty = None  # Speed settings used instead of DIFFICULTIES (tuning runs)
         
     def reset(self):
-        self.balloons = []
+        self.balloons = BalloonField(rng=self.rng)
+        self.particles = ParticlePool(rng=self.rng)
         self.balloon_count = 20
         self.balloons_popped = 0
         self.level = 1
         self.target_balloons = 10
+        self.target_increase = 5  # Added to the target on each level up
         self.current_difficulty = "medium"  # Reset to default
         self.score = 0
         self.paused = False
         self.game_over = False
         self.player_id = str(uuid.uuid4())
         self.skipped = False
+        self.rank = None  # Of the saved score among all scores
         self.name_input_active = False  # Add this line
             
     def load_scores(self):
-        if os.path.exists('scores.json'):
-            try:
-                with open('scores.json', 'r') as file:
-                    self.scores = json.load(file)
-                    # Ensure all scores have required fields
-                    for score in self.scores:
-                        if 'name' not in score:
-                            score['name'] = 'Anonymous'
-                        if 'difficulty' not in score:
-                            score['difficulty'] = 'medium'
-            except (json.JSONDecodeError, IOError):
-                # If file is corrupted, start fresh
-                self.scores = []
-        else:
-            self.scores = []
-    
-    def save_scores(self):
-        with open('scores.json', 'w') as file:
-            json.dump(self.scores, file)
+        self.scores = self.score_store.top(10)
     
     def add_score(self):
         if not self.skipped and self.player_name.strip():  # Only save if not skipped and name entered
-            self.scores.append({
+            self.rank = self.score_store.rank(self.score)
+            self.score_store.add({
                 "player_id": self.player_id,
                 "name": self.player_name,
                 "score": self.score,
@@ -105,168 +673,788 @@ class GameState:
                 "difficulty": self.current_difficulty,
                 "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             })
-            self.scores.sort(key=lambda x: x["score"], reverse=True)
-            self.save_scores()
+            self.load_scores()
     
     def play_music(self, track):
-        if not has_sound:
+        if not self.sound_enabled:
             return
             
         if self.music_playing == track:
             return
             
-        # Stop any currently playing music
-        pygame.mixer.stop()
-        
-        if track == "menu":
-            menu_music.play(-1)  # -1 means loop indefinitely
-            menu_music.set_volume(0.5)
-            self.music_playing = "menu"
-        elif track == "game":
-            background_music.play(-1)
-            background_music.set_volume(0.3)
-            self.music_playing = "game"
-        elif track is None:
-            pygame.mixer.stop()
-            self.music_playing = None
+        # Cross-fades from whatever is playing; sound effects keep playing
+        audio.play_music(track)
+        audio.duck_music(False)
+        self.music_playing = track
+
+# Text rendering cache
+class TextCache:
+    """Bounded LRU cache of rendered text, with outline and shadow baked in."""
+    OUTLINE_OFFSET = px(2)
+    SHADOW_OFFSET = px(3)
+    SHADOW_COLOR = (50, 50, 50)
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, text, font, color, outline_color=None, shadow=False):
+        # Returns (surface, origin, size): origin is the offset of the plain
+        # text inside the composited surface and size is the plain text size.
+        key = (text, font, color, outline_color, shadow)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+        self.misses += 1
+        entry = self._render(text, font, color, outline_color, shadow)
+        self.entries[key] = entry
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return entry
+
+    def _render(self, text, font, color, outline_color, shadow):
+        text_surface = font.render(text, True, color)
+        if not outline_color and not shadow:
+            return text_surface, (0, 0), text_surface.get_size()
+
+        pad = self.OUTLINE_OFFSET if outline_color else 0
+        extra = max(pad, self.SHADOW_OFFSET if shadow else 0)
+        width, height = text_surface.get_size()
+        surface = pygame.Surface((width + pad + extra, height + pad + extra), pygame.SRCALPHA)
+        if outline_color:
+            outline_surface = font.render(text, True, outline_color)
+            offset = self.OUTLINE_OFFSET
+            for dx, dy in [(-offset, 0), (offset, 0), (0, -offset), (0, offset)]:
+                surface.blit(outline_surface, (pad + dx, pad + dy))
+        if shadow:
+            surface.blit(font.render(text, True, self.SHADOW_COLOR),
+                         (pad + self.SHADOW_OFFSET, pad + self.SHADOW_OFFSET))
+        surface.blit(text_surface, (pad, pad))
+        return surface, (pad, pad), (width, height)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+    def clear(self):
+        self.entries.clear()
+
+text_cache = TextCache()
+
+# Screen updates
+class Renderer:
+    """Redraws and presents only the parts of the screen that changed."""
+    MAX_DIRTY_RECTS = 400  # Past this many rects one flip is cheaper
+    MAX_RESTORE_RECTS = 32  # Past this many, erase their bounding box in one blit
+
+    def __init__(self, dirty_rects=True):
+        self.dirty_rects = dirty_rects
+        self.page = None
+        self.full = True
+        self.layers = {}  # page -> (signature, layer surface)
+        self.backdrops = {}  # page -> screen it was entered over; kept across invalidate()
+        self.layer_signature = None
+        self.items = {}  # key -> (signature, rect) as last drawn on this page
+        self.volatile = []
+        self.previous_volatile = []
+        self.dirty = []
+
+    def begin(self, page, signature=None):
+        # Returns True when the page's static layer must be drawn; the caller
+        # draws it onto the screen and then calls capture().
+        if page != self.page or not self.dirty_rects:
+            self.page = page
+            self.full = True
+            self.items.clear()
+            self.volatile.clear()
+        self.previous_volatile, self.volatile = self.volatile, self.previous_volatile
+        self.volatile.clear()
+        layer = self.layers.get(page)
+        if layer is None or layer[0] != signature:
+            self.layer_signature = signature
+            self.full = True
+            self.items.clear()
+            return True
+        if self.full:
+            screen.blit(layer[1], (0, 0))
+        return False
+
+    def capture(self):
+        self.layers[self.page] = (self.layer_signature, screen.copy())
+
+    def keep_backdrop(self, page):
+        # For pages drawn over whatever the previous screen left behind, so
+        # rebuilding their layer starts from that frame and not from themselves
+        self.backdrops[page] = screen.copy()
+
+    def restore(self, rect):
+        screen.blit(self.layers[self.page][1], rect, rect)
+        self.dirty.append(rect)
+
+    def changed(self, key, signature, rect):
+        # True if the item has to be drawn this frame; its old and new areas
+        # are restored from the layer first so it draws onto a clean background.
+        old = self.items.get(key)
+        self.items[key] = (signature, rect)
+        if self.full:
+            return True
+        if old is not None and old[0] == signature and old[1] == rect:
+            return False
+        if old is not None:
+            self.restore(old[1])
+        self.restore(rect)
+        return True
+
+    def clear_volatile(self):
+        if self.full or not self.previous_volatile:
+            return
+        if len(self.previous_volatile) > self.MAX_RESTORE_RECTS:
+            self.restore(self.previous_volatile[0].unionall(self.previous_volatile))
+        else:
+            for rect in self.previous_volatile:
+                self.restore(rect)
+
+    def track(self, rects):
+        # Kept clipped to the area they were drawn in, so clear_volatile()'s
+        # merged box can't reach outside it; empty rects drew nothing
+        if rects is None:
+            return
+        if isinstance(rects, pygame.Rect):
+            rects = (rects,)
+        clip = screen.get_clip()
+        for rect in rects:
+            rect = rect.clip(clip)
+            if rect:
+                self.volatile.append(rect)
+
+    def invalidate(self):
+        self.layers.clear()
+        self.page = None
+
+    def redraw(self):
+        # Next frame redraws the whole page from its cached layer
+        self.page = None
+
+    def present(self):
+        if self.full or len(self.dirty) + len(self.volatile) > self.MAX_DIRTY_RECTS:
+            viewport.flip()
+        elif self.dirty or self.volatile:
+            self.dirty.extend(self.volatile)
+            viewport.update(self.dirty)
+        self.dirty.clear()
+        self.full = False
+
+renderer = Renderer()
+
+# Adaptive quality
+class QualityGovernor:
+    """Trades visual detail for frame rate when frames run over budget."""
+    LEVELS = ("full", "no strings", "no highlights", "no particles", "no outlines")
+    DROP_AFTER = 30  # Frames over budget before dropping a level
+    RESTORE_AFTER = 180  # Frames with headroom before restoring a level
+
+    def __init__(self, target_fps=60, enabled=True):
+        self.enabled = enabled
+        self.budget_ms = 1000 / target_fps
+        self.level = 0
+        self.average_ms = 0.0
+        self.over = 0
+        self.under = 0
+        self._apply()
+
+    def _apply(self):
+        self.strings = self.level < 1
+        self.highlights = self.level < 2
+        self.particles = self.level < 3
+        self.outlines = self.level < 4
+
+    def update(self, work_ms):
+        # work_ms: time spent on the last frame, excluding the frame-rate delay
+        if not self.enabled:
+            return
+        self.average_ms += (work_ms - self.average_ms) * 0.1
+        if self.average_ms > self.budget_ms * 0.9:
+            self.over += 1
+            self.under = 0
+        elif self.average_ms < self.budget_ms * 0.5:
+            self.under += 1
+            self.over = 0
+        else:
+            self.over = self.under = 0
+        if self.over >= self.DROP_AFTER and self.level < len(self.LEVELS) - 1:
+            self.set_level(self.level + 1)
+        elif self.under >= self.RESTORE_AFTER and self.level > 0:
+            self.set_level(self.level - 1)
+
+    def set_level(self, level):
+        outlines = self.outlines
+        self.level = level
+        self.over = self.under = 0
+        self._apply()
+        if self.outlines != outlines:
+            renderer.invalidate()  # Cached layers have outlined text baked in
+
+governor = QualityGovernor()
 
 # Utility functions
-def draw_text(text, font, color, x, y, outline_color=None, shadow=False, center=False):
-    text_surface = font.render(text, True, color)
-    text_rect = text_surface.get_rect()
+def layout_text(text, font, color, x, y, outline_color=None, shadow=False, center=False):
+    # Returns the cached surface and the screen rect it will cover
+    if not governor.outlines:
+        outline_color = None
+    surface, (ox, oy), size = text_cache.get(text, font, color, outline_color, shadow)
+    text_rect = pygame.Rect((0, 0), size)
     if center:
         text_rect.center = (x, y)
     else:
         text_rect.topleft = (x, y)
-    
-    if outline_color:
-        outline_offset = 2
-        for dx, dy in [(-outline_offset, 0), (outline_offset, 0), (0, -outline_offset), (0, outline_offset)]:
-            screen.blit(font.render(text, True, outline_color), text_rect.move(dx, dy))
-    if shadow:
-        screen.blit(font.render(text, True, (50, 50, 50)), text_rect.move(3, 3))
-    screen.blit(text_surface, text_rect)
-
-def draw_button(text, rect, color, hover_color, text_color=WHITE):
-    mouse_pos = pygame.mouse.get_pos()
-    is_hovered = rect.collidepoint(mouse_pos)
-    
-    pygame.draw.rect(screen, hover_color if is_hovered else color, rect, border_radius=10)
-    pygame.draw.rect(screen, BLACK, rect, 2, border_radius=10)
-    draw_text(text, FONT_MEDIUM, text_color, rect.centerx, rect.centery, center=True)
-    
-    return is_hovered and pygame.mouse.get_pressed()[0]
+    return surface, pygame.Rect(text_rect.x - ox, text_rect.y - oy, surface.get_width(), surface.get_height())
+
+def draw_text(text, font, color, x, y, outline_color=None, shadow=False, center=False):
+    surface, rect = layout_text(text, font, color, x, y, outline_color, shadow, center)
+    screen.blit(surface, rect)
+    return rect
+
+# Retained-mode UI
+class Button:
+    """A clickable button whose rect and label layout are fixed when it's built."""
+
+    def __init__(self, text, rect, color, hover_color, text_color=WHITE, on_click=None, selected=None):
+        self.text = text  # Or a callable of the state, as selected may be
+        self.rect = rect
+        self.bounds = rect.inflate(px(10), px(10))
+        self.color = color
+        self.hover_color = hover_color
+        self.text_color = text_color
+        self.on_click = on_click  # (state) -> screen to switch to, or None
+        self.selected = selected
+        self.labels = {}  # text -> (surface, rect)
+
+    def label(self, text):
+        label = self.labels.get(text)
+        if label is None:
+            label = layout_text(text, FONT_MEDIUM, self.text_color, self.rect.centerx, self.rect.centery, center=True)
+            self.labels[text] = label
+        return label
+
+    def draw(self, state, hovered=False):
+        # Only redrawn when its label, hover or selection changes
+        text = self.text(state) if callable(self.text) else self.text
+        selected = self.selected is not None and self.selected(state)
+        if renderer.changed(self, (text, hovered, selected), self.bounds):
+            pygame.draw.rect(screen, self.hover_color if hovered else self.color, self.rect, border_radius=px(10))
+            pygame.draw.rect(screen, BLACK, self.rect, px(2), border_radius=px(10))
+            screen.blit(*self.label(text))
+            if selected:
+                pygame.draw.rect(screen, BLACK, self.bounds, px(3), border_radius=px(15))
+
+class Page:
+    """One screen of the UI: a static background plus the widgets on top of it."""
 
-def draw_header(state):
+    def __init__(self, name, widgets, background=None, signature=None, on_enter=None):
+        self.name = name
+        self.widgets = widgets
+        self.rects = [widget.rect for widget in widgets]
+        self.background = background
+        self.signature = signature
+        self.on_enter = on_enter
+
+    def index_at(self, pos):
+        for index in range(len(self.rects)):
+            if self.rects[index].collidepoint(pos):
+                return index
+        return None
+
+    def enter(self, game):
+        game.pressed = None
+        game.hovered = self.index_at(game.pointer)
+        if self.on_enter is not None:
+            self.on_enter(game.state)
+
+    def handle(self, event, game):
+        # Returns the screen to switch to, or None
+        if event.type == pygame.MOUSEMOTION:
+            game.hovered = self.index_at(event.pos)
+        elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            game.pressed = self.index_at(event.pos)
+        elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+            index, pressed, game.pressed = self.index_at(event.pos), game.pressed, None
+            if index is not None and index == pressed and self.widgets[index].on_click is not None:
+                return self.widgets[index].on_click(game.state)
+        return None
+
+    def draw(self, state, hovered=None):
+        if self.background is not None:
+            if renderer.begin(self.name, None if self.signature is None else self.signature(state)):
+                self.background(state)
+                renderer.capture()
+        for index, widget in enumerate(self.widgets):
+            widget.draw(state, index == hovered)
+
+overlays = {}  # alpha -> full-screen translucent black surface
+
+def dim_overlay(alpha):
+    overlay = overlays.get(alpha)
+    if overlay is None:
+        overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
+        overlay.fill((0, 0, 0, alpha))
+        overlays[alpha] = overlay
+    return overlay
+
+def draw_header_bar():
     # Header background
-    header_rect = pygame.Rect(0, 0, WIDTH, 60)
+    header_rect = pygame.Rect(0, 0, WIDTH, HEADER_HEIGHT)
     pygame.draw.rect(screen, (70, 70, 70), header_rect)
-    pygame.draw.line(screen, BLACK, (0, 60), (WIDTH, 60), 2)
+    pygame.draw.line(screen, BLACK, (0, HEADER_HEIGHT), (WIDTH, HEADER_HEIGHT), px(2))
     
     # Game title on left
-    draw_text("Balloon Pop", FONT_MEDIUM, WHITE, 20, 30)
-    
-    # Pause and skip buttons on right
-    pause_btn = pygame.Rect(WIDTH - 180, 10, 80, 40)
-    skip_btn = pygame.Rect(WIDTH - 90, 10, 80, 40)
-    
-    if draw_button("Pause" if not state.paused else "Resume", pause_btn, 
-                  DARK_GRAY, GRAY):
-        state.paused = not state.paused
-        if has_sound and not state.paused and state.music_playing == "game":
-            background_music.set_volume(0.3)
-        elif has_sound and state.paused and state.music_playing == "game":
-            background_music.set_volume(0.1)
-    
-    if draw_button("Skip", skip_btn, (255, 165, 0), (255, 200, 0)):
-        state.game_over = True
-        state.skipped = True
-        return "game_over"
-    
-    return None
+    draw_text("Balloon Pop", FONT_MEDIUM, WHITE, px(20), px(30))
+
+def toggle_pause(state):
+    state.paused = not state.paused
+    if state.sound_enabled:
+        audio.duck_music(state.paused)
+
+def skip_game(state):
+    state.game_over = True
+    state.skipped = True
+    return "game_over"
+
+# Pause and skip buttons on the right of the header, over the game screen
+header = Page("game", [
+    Button(lambda state: "Resume" if state.paused else "Pause", pygame.Rect(WIDTH - px(180), px(10), px(80), px(40)),
+           DARK_GRAY, GRAY, on_click=toggle_pause),
+    Button("Skip", pygame.Rect(WIDTH - px(90), px(10), px(80), px(40)), (255, 165, 0), (255, 200, 0),
+           on_click=skip_game)
+])
 
 # Balloon functions
-def create_balloon(state, x=None, y=None):
-    size = random.randint(40, 70)
-    x = random.randint(0, WIDTH - size) if x is None else x
-    y = HEIGHT + 50 if y is None else y
-    color = random.choice(BALLOON_COLORS)
-    settings = DIFFICULTIES[state.current_difficulty]
+class BalloonField:
+    """All live balloons, stored as parallel NumPy arrays (one entry per balloon)."""
+    SCALAR_SPAWN_MAX = 16  # Up to this many, x positions are drawn one call at a time
+    BANDS = 8  # Horizontal strips of the screen; drawn balloons are bounded per strip
+    BAND_HEIGHT = -(-HEIGHT // BANDS)
+
+    def __init__(self, capacity=64, rng=None):
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.count = 0
+        self.x = np.zeros(capacity, dtype=np.float64)
+        self.y = np.zeros(capacity, dtype=np.float64)
+        self.w = np.zeros(capacity, dtype=np.int32)
+        self.h = np.zeros(capacity, dtype=np.int32)
+        self.speed = np.zeros(capacity, dtype=np.float64)
+        self.color = np.zeros(capacity, dtype=np.int8)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self._scratch(capacity)
+        self.escaped = 0  # Balloons that left the top of the screen on the last cull
+        self.grid = BalloonGrid()
+
+    def __len__(self):
+        return self.count
+
+    def _scratch(self, capacity):
+        # Reused work buffers, so per-frame updates don't allocate. Whole
+        # arrays are processed: slots past count are dead and never read.
+        self.step = np.zeros(capacity, dtype=np.float64)
+        self.mask = np.zeros(capacity, dtype=bool)
+        self.keep = np.zeros(capacity, dtype=bool)
+        self.left = np.zeros(capacity, dtype=np.int32)  # Drawn corners and far edges
+        self.top = np.zeros(capacity, dtype=np.int32)
+        self.right = np.zeros(capacity, dtype=np.int32)
+        self.bottom = np.zeros(capacity, dtype=np.int32)
+        self.band = np.zeros(capacity, dtype=np.int32)
+        # Whole (band, slot) tables: ufuncs on broadcast operands allocate buffers
+        self.band_index = np.repeat(np.arange(self.BANDS, dtype=np.int32)[:, None], capacity, axis=1)
+        self.bands = np.zeros((self.BANDS, capacity), dtype=np.int32)
+        self.in_band = np.zeros((self.BANDS, capacity), dtype=bool)
+        self.band_bounds = np.zeros((4, self.BANDS), dtype=np.int32)
+
+    def _grow(self, needed):
+        capacity = len(self.x)
+        while capacity < needed:
+            capacity *= 2
+        for name in ("x", "y", "w", "h", "speed", "color", "alive"):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+        self._scratch(capacity)
+
+    def spawn(self, count, min_speed, max_speed, y=None):
+        # A batch is staggered downwards by one frame of travel each, so it rises as a stream
+        if count <= 0:
+            return
+        start, end = self.count, self.count + count
+        if end > len(self.x):
+            self._grow(end)
+        rng = self.rng
+        size = rng.integers(40, 71, count)  # Design width
+        speed = rng.uniform(min_speed, max_speed, count)
+        self.w[start:end] = size * RENDER_SCALE  # Truncated, as BalloonAtlas.build() expects
+        self.h[start:end] = (size * 1.2 * RENDER_SCALE).astype(np.int32)
+        # Same numbers either way; small batches skip the array-bound call's buffers
+        if count <= self.SCALAR_SPAWN_MAX:
+            for i, width in enumerate(self.w[start:end].tolist(), start):
+                self.x[i] = rng.integers(0, WIDTH - width + 1)
+        else:
+            self.x[start:end] = rng.integers(0, WIDTH - self.w[start:end] + 1)
+        base_y = HEIGHT + px(50) if y is None else y
+        self.y[start:end] = base_y + np.arange(count) * speed
+        self.speed[start:end] = speed
+        self.color[start:end] = rng.integers(0, len(BALLOON_COLORS), count)
+        self.alive[start:end] = True
+        self.count = end
+        self.grid.stale = True
+
+    def move(self, frames=1.0):
+        # Speeds are in pixels per 1/60 s frame; frames is the elapsed time in those units
+        np.multiply(self.speed, frames, out=self.step)
+        self.y -= self.step
+        self.grid.stale = True
+
+    def cull(self):
+        # Drop popped balloons and those that have risen above the header,
+        # compacting the arrays in place while keeping draw order.
+        n = self.count
+        np.add(self.y, self.h, out=self.step)
+        np.greater_equal(self.step, HEADER_HEIGHT, out=self.keep)
+        self.keep &= self.alive
+        np.not_equal(self.alive, self.keep, out=self.mask)  # keep is a subset of alive
+        escaped = int(np.count_nonzero(self.mask))
+        self.escaped = escaped
+        kept = int(np.count_nonzero(self.keep))
+        if kept != n:
+            keep = self.keep[:n]
+            for name in ("x", "y", "w", "h", "speed", "color"):
+                array = getattr(self, name)
+                array[:kept] = array[:n][keep]
+            self.alive[:kept] = True
+            self.alive[kept:n] = False
+            self.count = kept
+            self.grid.stale = True
+        return escaped
+
+    def pop_at(self, x, y):
+        # Pops every balloon under the point; only balloons below the header count
+        if self.grid.stale:
+            self.grid.rebuild(self)
+        hit = self.grid.query(self, x, y)
+        self.alive[hit] = False
+        return len(hit)
+
+    def pop_at_points(self, points):
+        # Clicks are resolved in order, so a balloon popped by an earlier
+        # click in the batch can't be popped again by a later one.
+        return [self.pop_at(x, y) for x, y in points]
+
+    def visible(self):
+        # Indices of live balloons between the header and the bottom of the
+        # screen, in draw order; keep is only scratch here
+        np.greater(self.y, HEADER_HEIGHT, out=self.mask)
+        np.less(self.y, HEIGHT, out=self.keep)
+        self.mask &= self.keep
+        self.mask &= self.alive
+        return np.flatnonzero(self.mask)
+
+    def corners(self):
+        # Top-left corner of every slot as drawn; truncated, like blit does
+        np.copyto(self.left, self.x, casting="unsafe")
+        np.copyto(self.top, self.y, casting="unsafe")
+
+    def bounds(self, extra_height=0):
+        # (left, top, right, bottom) around the balloons visible() picked, per
+        # band their tops are in, after corners(); empty bands have left > right
+        np.add(self.left, self.w, out=self.right)
+        np.add(self.top, self.h, out=self.bottom)
+        self.bottom += extra_height
+        np.floor_divide(self.top, self.BAND_HEIGHT, out=self.band)
+        np.logical_not(self.mask, out=self.keep)
+        np.copyto(self.band, -1, where=self.keep)
+        np.copyto(self.bands, self.band)
+        np.equal(self.bands, self.band_index, out=self.in_band)
+        for values, reduce, initial, out in ((self.left, np.minimum.reduce, 2 ** 31 - 1, self.band_bounds[0]),
+                                             (self.top, np.minimum.reduce, 2 ** 31 - 1, self.band_bounds[1]),
+                                             (self.right, np.maximum.reduce, -2 ** 31, self.band_bounds[2]),
+                                             (self.bottom, np.maximum.reduce, -2 ** 31, self.band_bounds[3])):
+            np.copyto(self.bands, values)  # Reduced per band row
+            reduce(self.bands, axis=1, where=self.in_band, initial=initial, out=out)
+        return self.band_bounds.T.tolist()
+
+class BalloonGrid:
+    """Uniform grid over poppable balloons, bucketed by each balloon's top-left cell."""
+    CELL_SIZE = px(96)
+
+    def __init__(self):
+        self.stale = True
+        self.order = np.zeros(0, dtype=np.intp)
+        self.bounds = np.zeros(1, dtype=np.intp)
+        self.cols = WIDTH // self.CELL_SIZE + 1
+        self.rows = (HEIGHT - HEADER_HEIGHT) // self.CELL_SIZE + 1
+
+    def rebuild(self, balloons):
+        n = balloons.count
+        y = balloons.y[:n]
+        indexed = np.flatnonzero(balloons.alive[:n] & (y > HEADER_HEIGHT) & (y < HEIGHT))
+        cell_x = (balloons.x[indexed] // self.CELL_SIZE).astype(np.intp)
+        cell_y = ((y[indexed] - HEADER_HEIGHT) // self.CELL_SIZE).astype(np.intp)
+        keys = cell_y * self.cols + cell_x
+        order = np.argsort(keys, kind="stable")
+        self.order = indexed[order]
+        self.bounds = np.searchsorted(keys[order], np.arange(self.rows * self.cols + 1))
+        self.stale = False
+
+    def query(self, balloons, point_x, point_y):
+        if point_y <= HEADER_HEIGHT or point_y >= HEIGHT:
+            return self.order[:0]
+        cell_x = int(point_x // self.CELL_SIZE)
+        cell_y = int((point_y - HEADER_HEIGHT) // self.CELL_SIZE)
+        buckets = []
+        for cy in (cell_y - 1, cell_y):
+            if not 0 <= cy < self.rows:
+                continue
+            for cx in (cell_x - 1, cell_x):
+                if 0 <= cx < self.cols:
+                    key = cy * self.cols + cx
+                    buckets.append(self.order[self.bounds[key]:self.bounds[key + 1]])
+        candidates = np.sort(np.concatenate(buckets)) if buckets else self.order[:0]
+        x, y = balloons.x[candidates], balloons.y[candidates]
+        hit = (balloons.alive[candidates]
+               & (x <= point_x) & (point_x < x + balloons.w[candidates])
+               & (y <= point_y) & (point_y < y + balloons.h[candidates]))
+        return candidates[hit]
+
+def create_balloons(state, count=1, y=None):
+    settings = state.custom_difficulty or DIFFICULTIES[state.current_difficulty]
     min_speed = settings["min_speed"] + state.level * settings["speed_increase"]
     max_speed = settings["max_speed"] + state.level * settings["speed_increase"]
-    return {
-        "rect": pygame.Rect(x, y, size, int(size * 1.2)),
-        "color": color,
-        "speed": random.uniform(min_speed, max_speed),
-        "popped": False
-    }
+    # Speeds are set in design pixels per frame
+    state.balloons.spawn(count, min_speed * RENDER_SCALE, max_speed * RENDER_SCALE, y)
 
-def draw_balloon(balloon):
-    rect = balloon["rect"]
-    color = balloon["color"]
-    pygame.draw.ellipse(screen, color, rect)
+def draw_balloon_body(surface, rect, color, highlight=True):
+    pygame.draw.ellipse(surface, color, rect)
+    if not highlight:
+        return
     
     highlight_color = (min(color[0] + 100, 255), min(color[1] + 100, 255), min(color[2] + 100, 255))
     highlight_rect = pygame.Rect(rect.x + rect.width // 4, rect.y + rect.height // 6, rect.width // 3, rect.height // 3)
-    pygame.draw.ellipse(screen, highlight_color, highlight_rect)
+    pygame.draw.ellipse(surface, highlight_color, highlight_rect)
 
-def draw_balloon_string(balloon):
-    start_x, start_y = balloon["rect"].centerx, balloon["rect"].bottom
+def draw_balloon_string(surface, rect):
+    start_x, start_y = rect.centerx, rect.bottom
     points = []
     for i in range(20):
-        x_offset = 10 * math.sin(i * 0.3 * math.pi)
-        points.append((start_x + x_offset, start_y + i * 5))
-    pygame.draw.lines(screen, BLACK, False, points, 2)
+        x_offset = 10 * RENDER_SCALE * math.sin(i * 0.3 * math.pi)
+        points.append((start_x + x_offset, start_y + i * 5 * RENDER_SCALE))
+    pygame.draw.lines(surface, BLACK, False, points, px(2))
+
+# Balloon sprite atlas
+class BalloonAtlas:
+    """Pre-rendered balloon sprites, one per size, color and detail level."""
+    STRING_LENGTH = px(19 * 5 + 2)
+
+    def __init__(self):
+        self.sprites = {}
+
+    def get(self, width, height, color, string=True, highlight=True):
+        key = (width, height, color, string, highlight)
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            sprite = self._render(width, height, color, string, highlight)
+            self.sprites[key] = sprite
+        return sprite
+
+    def _render(self, width, height, color, string, highlight):
+        surface = pygame.Surface((width, height + (self.STRING_LENGTH if string else 0)), pygame.SRCALPHA)
+        rect = pygame.Rect(0, 0, width, height)
+        if string:
+            draw_balloon_string(surface, rect)
+        draw_balloon_body(surface, rect, color, highlight)
+        if pygame.display.get_surface() is not None:
+            surface = surface.convert_alpha()
+        return surface
+
+    def build(self):
+        # Render every sprite create_balloon can produce up front
+        for size in range(40, 71):
+            for color in BALLOON_COLORS:
+                self.get(int(size * RENDER_SCALE), int(size * 1.2 * RENDER_SCALE), color)
+
+balloon_atlas = BalloonAtlas()
+
+def draw_balloons(balloons):
+    # Returns rects around the balloons drawn, one per band of the screen, or
+    # per run of bands whose boxes overlap so no area is erased twice
+    visible = balloons.visible()
+    if not len(visible):
+        return None
+    balloons.corners()
+    get_sprite = balloon_atlas.get
+    string, highlight = governor.strings, governor.highlights
+    left, top, w, h, color = balloons.left, balloons.top, balloons.w, balloons.h, balloons.color
+    # A generator rather than a list: each blit's arguments are freed as it goes
+    screen.blits(((get_sprite(w.item(i), h.item(i), BALLOON_COLORS[color.item(i)], string, highlight),
+                   (left.item(i), top.item(i))) for i in visible), doreturn=False)
+    extra = BalloonAtlas.STRING_LENGTH if string else 0
+    rects = []
+    for x, y, right, bottom in balloons.bounds(extra):
+        if x > right:
+            continue  # Nothing in this band
+        if rects and y < rects[-1].bottom:
+            rects[-1].union_ip((x, y, right - x, bottom - y))
+        else:
+            rects.append(pygame.Rect(x, y, right - x, bottom - y))
+    return rects
+
+# Particle system
+class ParticlePool:
+    """Fixed-capacity particle storage; new bursts overwrite the oldest particles."""
+    MAX_RADIUS = 5  # Radii are in design pixels; SPRITE_RADIUS has them in internal pixels
+    SPRITE_RADIUS = np.array([px(radius) for radius in range(MAX_RADIUS + 1)], dtype=np.float64)
+    sprites = {}  # color * 8 + radius -> surface, shared so pools stay copyable
+
+    def __init__(self, capacity=512, rng=None):
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.capacity = capacity
+        self.pos = np.zeros((capacity, 2), dtype=np.float64)
+        self.velocity = np.zeros((capacity, 2), dtype=np.float64)
+        self.lifetime = np.zeros(capacity, dtype=np.float32)  # In 1/60 s frames
+        self.color = np.zeros(capacity, dtype=np.int8)
+        self.radius = np.zeros(capacity, dtype=np.int8)
+        self.offset = np.zeros((capacity, 2), dtype=np.float64)  # Sprite radius, per axis
+        self.sprite_key = np.zeros(capacity, dtype=np.int32)  # Key into sprites
+        self.step = np.zeros((capacity, 2), dtype=np.float64)
+        self.live = np.zeros(capacity, dtype=bool)
+        self.corners = np.zeros((capacity, 2), dtype=np.int32)
+        self.low = np.zeros((capacity, 2), dtype=np.int32)  # Live corners, dead ones pushed out of range
+        self.high = np.zeros((capacity, 2), dtype=np.int32)
+        # First slot of each burst, and of what is left of one partly overwritten
+        self.burst_start = np.zeros(capacity, dtype=bool)
+        self.burst_start[0] = True
+        self.head = 0  # Next slot to write; slots are reused in spawn order
+
+    def spawn(self, x, y, count=15):
+        count = min(count, self.capacity)
+        slots = (self.head + np.arange(count)) % self.capacity
+        self.head = (self.head + count) % self.capacity
+        self.burst_start[slots] = False
+        self.burst_start[[0, slots[0], self.head]] = True
+        rng = self.rng
+        self.pos[slots, 0] = x + rng.integers(-15, 16, count) * RENDER_SCALE
+        self.pos[slots, 1] = y + rng.integers(-15, 16, count) * RENDER_SCALE
+        self.velocity[slots] = rng.uniform(-2, 2, (count, 2)) * RENDER_SCALE
+        self.lifetime[slots] = rng.integers(20, 41, count)
+        self.color[slots] = rng.integers(0, len(BALLOON_COLORS), count)
+        self.radius[slots] = rng.integers(2, self.MAX_RADIUS + 1, count)
+        self.offset[slots] = self.SPRITE_RADIUS[self.radius[slots], None]
+        self.sprite_key[slots] = self.color[slots] * 8 + self.radius[slots]
+
+    def update(self, frames=1.0):
+        # Whole arrays, rather than copies of the live particles
+        np.multiply(self.velocity, frames, out=self.step)
+        self.pos += self.step  # Dead particles drift too; they are never drawn
+        self.lifetime -= frames
+        np.maximum(self.lifetime, 0, out=self.lifetime)
+
+    def live_count(self):
+        return int(np.count_nonzero(self.lifetime > 0))
+
+    def clear(self):
+        self.lifetime[:] = 0
+
+    def _build_sprites(self):
+        for color, rgb in enumerate(BALLOON_COLORS):
+            for radius in range(1, self.MAX_RADIUS + 1):
+                size = int(self.SPRITE_RADIUS[radius])
+                sprite = pygame.Surface((size * 2, size * 2), pygame.SRCALPHA)
+                pygame.draw.circle(sprite, rgb, (size, size), size)
+                self.sprites[color * 8 + radius] = sprite
+
+    def draw(self, surface):
+        # Returns a rect bounding each burst drawn, so far-apart pops don't
+        # dirty everything between them
+        np.greater(self.lifetime, 0, out=self.live)
+        live = np.flatnonzero(self.live)
+        if not len(live):
+            return None
+        if not self.sprites:
+            self._build_sprites()
+        corners, keys, sprites = self.corners, self.sprite_key, self.sprites
+        np.subtract(self.pos, self.offset, out=self.step)
+        np.copyto(corners, self.step, casting="unsafe")  # Truncates, like blit does
+        # A generator rather than a list: each blit's arguments are freed as it goes
+        surface.blits(((sprites[keys.item(i)], (corners.item(i, 0), corners.item(i, 1))) for i in live),
+                      doreturn=False)
+        # Bursts fill runs of slots, so each one's bounds are a reduction over its run
+        self.low.fill(2 ** 31 - 1)
+        np.copyto(self.low, corners, where=self.live[:, None])
+        self.high.fill(-2 ** 31)
+        np.copyto(self.high, corners, where=self.live[:, None])
+        starts = np.flatnonzero(self.burst_start)
+        lows = np.minimum.reduceat(self.low, starts).tolist()
+        highs = np.maximum.reduceat(self.high, starts).tolist()
+        size = 2 * int(self.SPRITE_RADIUS[-1])
+        clip = surface.get_clip()
+        rects = (pygame.Rect(left, top, right - left + size, bottom - top + size).clip(clip)
+                 for (left, top), (right, bottom) in zip(lows, highs) if left <= right)
+        return [rect for rect in rects if rect]  # Bursts wholly outside the clip drew nothing
 
 def pop_effect(x, y, state):
-    if has_sound:
-        pop_sound.play()
-    
-    particles = []
-    for _ in range(15):
-        particle_x = x + random.randint(-15, 15)
-        particle_y = y + random.randint(-15, 15)
-        velocity = [random.uniform(-2, 2), random.uniform(-2, 2)]
-        lifetime = random.randint(20, 40)
-        particles.append({"pos": [particle_x, particle_y], "velocity": velocity, "color": random.choice(BALLOON_COLORS), "lifetime": lifetime})
-    
-    for particle in particles:
-        pygame.draw.circle(screen, particle["color"], (int(particle["pos"][0]), int(particle["pos"][1])), random.randint(2, 5))
-        particle["pos"][0] += particle["velocity"][0]
-        particle["pos"][1] += particle["velocity"][1]
-        particle["lifetime"] -= 1
+    if state.sound_enabled:
+        audio.play_sfx(assets.sound("pop"))
+    state.particles.spawn(x, y)
+
+def pop_balloons(state, clicks):
+    for pos, popped in zip(clicks, state.balloons.pop_at_points(clicks)):
+        for _ in range(popped):
+            state.score += 1
+            state.balloons_popped += 1
+            pop_effect(pos[0], pos[1], state)
 
 # Screen functions
-def draw_name_input_screen(state):
-    screen.blit(sky_image, (0, 0))
+def draw_name_input_background(state):
+    screen.blit(assets.image("sky"), (0, 0))
     
     # Title
-    draw_text("Enter Your Name", FONT_LARGE, BLACK, WIDTH // 2, 150, center=True)
+    draw_text("Enter Your Name", FONT_LARGE, BLACK, WIDTH // 2, px(150), center=True)
     
     # Input box
-    input_rect = pygame.Rect(WIDTH // 2 - 200, 250, 400, 60)
+    input_rect = pygame.Rect(WIDTH // 2 - px(200), px(250), px(400), px(60))
     pygame.draw.rect(screen, WHITE, input_rect)
-    pygame.draw.rect(screen, BLACK, input_rect, 2)
-    
-    # Display current name
-    name_text = state.player_name if state.player_name else "Type your name here"
-    name_color = BLACK if state.player_name else GRAY
-    draw_text(name_text, FONT_MEDIUM, name_color, WIDTH // 2, 280, center=True)
-    
-    # Submit button
-    submit_btn = pygame.Rect(WIDTH // 2 - 100, 350, 200, 50)
-    if draw_button("Submit", submit_btn, GREEN, (100, 255, 100), BLACK):
-        if state.player_name.strip():  # Only proceed if name isn't empty
-            return "manual"
-    
-    return "name_input"
+    pygame.draw.rect(screen, BLACK, input_rect, px(2))
+
+class NameField:
+    """The player name typed so far, or a prompt while it's empty."""
+    on_click = None
+
+    def __init__(self, rect):
+        self.rect = rect
+
+    def draw(self, state, hovered=False):
+        name_text = state.player_name if state.player_name else "Type your name here"
+        name_color = BLACK if state.player_name else GRAY
+        text_surface, text_rect = layout_text(name_text, FONT_MEDIUM, name_color, self.rect.centerx, self.rect.centery, center=True)
+        if renderer.changed(self, (name_text, name_color), text_rect):
+            screen.blit(text_surface, text_rect)
+
+def submit_name(state):
+    if state.player_name.strip():  # Only proceed if name isn't empty
+        return "manual"
+    return None
+
+def draw_manual_background(state):
+    screen.blit(assets.image("sky"), (0, 0))
 
-def draw_manual_screen(state):
-    screen.blit(sky_image, (0, 0))
-    
     # Title
-    draw_text("How to Play", FONT_LARGE, RED, WIDTH // 2, 50, outline_color=BLACK, center=True)
-    
+    draw_text("How to Play", FONT_LARGE, RED, WIDTH // 2, px(50), outline_color=BLACK, center=True)
+
     # Instructions
     instructions = [
         "Welcome to Balloon Pop!",
@@ -284,200 +1472,495 @@ def draw_manual_screen(state):
         "- Pause: Temporarily stop the game",
         "- Skip: End current game early"
     ]
-    
+
     for i, line in enumerate(instructions):
-        y_pos = 120 + i * 30
+        y_pos = px(120 + i * 30)
         if i == 0:  # First line (title)
             draw_text(line, FONT_MEDIUM, BLUE, WIDTH // 2, y_pos, center=True)
         elif line and line[0] == "-":  # Bullet points
-            draw_text(line, FONT_SMALL, BLACK, WIDTH // 2 - 250, y_pos)
+            draw_text(line, FONT_SMALL, BLACK, WIDTH // 2 - px(250), y_pos)
         elif line:  # Section headers
-            draw_text(line, FONT_SMALL, (0, 100, 0), WIDTH // 2 - 250, y_pos)
-    
-    # Continue button
-    continue_btn = pygame.Rect(WIDTH // 2 - 100, HEIGHT - 100, 200, 50)
-    if draw_button("Continue", continue_btn, GREEN, (100, 255, 100), BLACK):
-        return "start"
-    
-    return "manual"
+            draw_text(line, FONT_SMALL, (0, 100, 0), WIDTH // 2 - px(250), y_pos)
 
-def draw_start_screen(state):
-    state.play_music("menu")
-    screen.blit(sky_image, (0, 0))
-    draw_text("Balloon Pop!", FONT_LARGE, RED, WIDTH // 2, 150, outline_color=BLACK, center=True)
-    
-    # Difficulty buttons
-    easy_btn = pygame.Rect(WIDTH // 2 - 150, 250, 300, 50)
-    medium_btn = pygame.Rect(WIDTH // 2 - 150, 320, 300, 50)
-    hard_btn = pygame.Rect(WIDTH // 2 - 150, 390, 300, 50)
-    
-    if draw_button("Easy", easy_btn, GREEN, (100, 255, 100), BLACK):
-        state.current_difficulty = "easy"
-    if draw_button("Medium", medium_btn, BLUE, (100, 100, 255), WHITE):
-        state.current_difficulty = "medium"
-    if draw_button("Hard", hard_btn, RED, (255, 100, 100), WHITE):
-        state.current_difficulty = "hard"
-    
-    # Highlight selected difficulty
-    if state.current_difficulty == "easy":
-        pygame.draw.rect(screen, BLACK, easy_btn.inflate(10, 10), 3, border_radius=15)
-    elif state.current_difficulty == "medium":
-        pygame.draw.rect(screen, BLACK, medium_btn.inflate(10, 10), 3, border_radius=15)
-    else:
-        pygame.draw.rect(screen, BLACK, hard_btn.inflate(10, 10), 3, border_radius=15)
-    
-    # Start and score buttons
-    start_btn = pygame.Rect(WIDTH // 2 - 150, 470, 300, 60)
-    scores_btn = pygame.Rect(WIDTH // 2 - 150, 550, 300, 60)
-    
-    if draw_button("Start Game", start_btn, (100, 100, 255), (150, 150, 255)):
-        state.play_music("game")
-        return "game"
-    if draw_button("High Scores", scores_btn, (255, 165, 0), (255, 200, 0)):
-        return "scores"
-    
-    return "start"
+def draw_start_background(state):
+    screen.blit(assets.image("sky"), (0, 0))
+    draw_text("Balloon Pop!", FONT_LARGE, RED, WIDTH // 2, px(150), outline_color=BLACK, center=True)
+
+def difficulty_button(name, y, color, hover_color, text_color):
+    # The selected difficulty is drawn highlighted
+    def select(state):
+        state.current_difficulty = name
+    return Button(name.capitalize(), pygame.Rect(WIDTH // 2 - px(150), px(y), px(300), px(50)),
+                  color, hover_color, text_color, on_click=select,
+                  selected=lambda state: state.current_difficulty == name)
+
+def start_game(state):
+    state.play_music("game")
+    return "game"
+
+def scores_table(state):
+    return tuple((score.get('name'), score['score'], score['level'], score.get('difficulty'))
+                 for score in state.scores[:10])
+
+def draw_scores_background(state):
+    screen.blit(assets.image("sky"), (0, 0))
+    draw_text("High Scores", FONT_LARGE, RED, WIDTH // 2, px(50), outline_color=BLACK, center=True)
 
-def draw_scores_screen(state):
-    screen.blit(sky_image, (0, 0))
-    draw_text("High Scores", FONT_LARGE, RED, WIDTH // 2, 50, outline_color=BLACK, center=True)
-    
     # Table header
-    header_y = 120
-    draw_text("Name", FONT_MEDIUM, BLACK, WIDTH // 2 - 200, header_y)
-    draw_text("Score", FONT_MEDIUM, BLACK, WIDTH // 2 - 50, header_y)
-    draw_text("Level", FONT_MEDIUM, BLACK, WIDTH // 2 + 100, header_y)
-    draw_text("Difficulty", FONT_MEDIUM, BLACK, WIDTH // 2 + 250, header_y)
-    
+    header_y = px(120)
+    draw_text("Name", FONT_MEDIUM, BLACK, WIDTH // 2 - px(200), header_y)
+    draw_text("Score", FONT_MEDIUM, BLACK, WIDTH // 2 - px(50), header_y)
+    draw_text("Level", FONT_MEDIUM, BLACK, WIDTH // 2 + px(100), header_y)
+    draw_text("Difficulty", FONT_MEDIUM, BLACK, WIDTH // 2 + px(250), header_y)
+
     # Scores list
     if not state.scores:
         draw_text("No scores yet!", FONT_MEDIUM, BLACK, WIDTH // 2, HEIGHT // 2, center=True)
     else:
         for i, score in enumerate(state.scores[:10]):  # Show top 10 scores
-            y_pos = header_y + 50 + i * 40
-            draw_text(f"{i+1}.", FONT_SMALL, BLACK, WIDTH // 2 - 250, y_pos)
-            draw_text(score.get('name', 'Anonymous')[:12], FONT_SMALL, BLACK, WIDTH // 2 - 200, y_pos)
-            draw_text(str(score['score']), FONT_SMALL, BLACK, WIDTH // 2 - 50, y_pos)
-            draw_text(str(score['level']), FONT_SMALL, BLACK, WIDTH // 2 + 100, y_pos)
-            draw_text(score.get('difficulty', 'medium').capitalize(), FONT_SMALL, BLACK, WIDTH // 2 + 250, y_pos)
-    
-    # Back button
-    back_btn = pygame.Rect(WIDTH // 2 - 100, HEIGHT - 100, 200, 50)
-    if draw_button("Back", back_btn, RED, (255, 100, 100)):
-        return "start"
-    
-    return "scores"
+            y_pos = header_y + px(50 + i * 40)
+            draw_text(f"{i+1}.", FONT_SMALL, BLACK, WIDTH // 2 - px(250), y_pos)
+            draw_text(score.get('name', 'Anonymous')[:12], FONT_SMALL, BLACK, WIDTH // 2 - px(200), y_pos)
+            draw_text(str(score['score']), FONT_SMALL, BLACK, WIDTH // 2 - px(50), y_pos)
+            draw_text(str(score['level']), FONT_SMALL, BLACK, WIDTH // 2 + px(100), y_pos)
+            draw_text(score.get('difficulty', 'medium').capitalize(), FONT_SMALL, BLACK, WIDTH // 2 + px(250), y_pos)
 
-def draw_game_screen(state, elapsed_time, total_time):
-    screen.blit(sky_image, (0, 0))
-    
-    # Draw header with title and buttons
-    header_result = draw_header(state)
-    if header_result:
-        return header_result
-    
-    # Game info below header
-    time_left = max(0, (total_time - elapsed_time) // 1000)
-    draw_text(f"Score: {state.score}", FONT_SMALL, WHITE, 20, 80)
-    draw_text(f"Time: {time_left}s", FONT_SMALL, WHITE, WIDTH - 150, 80)
-    draw_text(f"Level: {state.level}", FONT_SMALL, WHITE, 20, HEIGHT - 40)
-    draw_text(f"Target: {state.target_balloons - state.balloons_popped}", FONT_SMALL, WHITE, WIDTH - 150, HEIGHT - 40)
-    
+def update_game(state, elapsed_time, total_time, frame_time=1000 / 60):
+    # Advances the game by frame_time ms and returns the next screen; no drawing
     if state.paused:
-        overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-        overlay.fill((0, 0, 0, 150))
-        screen.blit(overlay, (0, 0))
-        draw_text("PAUSED", FONT_LARGE, WHITE, WIDTH // 2, HEIGHT // 2, center=True)
         return "game"
     
-    # Update and draw balloons (under the header)
-    for balloon in state.balloons[:]:
-        if not state.paused and not balloon["popped"]:
-            balloon["rect"].y -= balloon["speed"]
-        
-        # Only draw if below header (y > 60)
-        if balloon["rect"].y > 60:
-            draw_balloon_string(balloon)
-            draw_balloon(balloon)
-        
-        if balloon["rect"].bottom < 60:  # Changed from 0 to 60 (header height)
-            state.balloons.remove(balloon)
+    frames = frame_time * 60 / 1000
+    state.balloons.move(frames)
+    state.balloons.cull()
+    state.particles.update(frames)
     
     # Create new balloons if needed (starting below visible area)
-    if len(state.balloons) < state.balloon_count + state.level * 2 and not state.paused:
-        state.balloons.append(create_balloon(state))
+    missing = state.balloon_count + state.level * 2 - len(state.balloons)
+    if missing > 0:
+        create_balloons(state, missing)
     
     # Check level progression
-    if state.balloons_popped >= state.target_balloons and not state.paused:
+    if state.balloons_popped >= state.target_balloons:
         state.level += 1
-        state.target_balloons += 5
+        state.target_balloons += state.target_increase
         state.balloons_popped = 0
     
     # Check game over
-    if elapsed_time >= total_time and not state.paused:
+    if elapsed_time >= total_time:
         state.game_over = True
         return "game_over"
     
     return "game"
 
-def draw_game_over_screen(state):
-    overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-    overlay.fill((0, 0, 0, 180))
-    screen.blit(overlay, (0, 0))
+PLAY_AREA = pygame.Rect(0, HEADER_HEIGHT + 1, WIDTH, HEIGHT - HEADER_HEIGHT - 1)  # Everything below the header
+
+hud_items = {}  # label -> (value, surface, rect) as last laid out
+
+def draw_hud_item(label, value, x, y):
+    # Formats and lays out the text only when the value changes
+    item = hud_items.get(label)
+    if item is None or item[0] != value:
+        item = (value,) + layout_text(label.format(value), FONT_SMALL, WHITE, x, y)
+        hud_items[label] = item
+    screen.blit(item[1], item[2])
+    return item[2]
+
+def draw_hud(state, time_left):
+    # Game info below header; returns the rects drawn
+    return (draw_hud_item("Score: {}", state.score, px(20), px(80)),
+            draw_hud_item("Time: {}s", time_left, WIDTH - px(150), px(80)),
+            draw_hud_item("Level: {}", state.level, px(20), HEIGHT - px(40)),
+            draw_hud_item("Target: {}", state.target_balloons - state.balloons_popped,
+                          WIDTH - px(150), HEIGHT - px(40)))
+
+def draw_game_screen(state, elapsed_time, total_time, hovered=None):
+    time_left = max(0, (total_time - elapsed_time) // 1000)
     
-    box_rect = pygame.Rect(WIDTH // 2 - 250, HEIGHT // 2 - 200, 500, 400)
-    pygame.draw.rect(screen, WHITE, box_rect, border_radius=20)
-    pygame.draw.rect(screen, BLACK, box_rect, 3, border_radius=20)
+    if state.paused:
+        if renderer.begin("paused", (state.score, time_left, state.level, state.balloons_popped)):
+            screen.blit(assets.image("sky"), (0, 0))
+            draw_header_bar()
+            draw_hud(state, time_left)
+            screen.blit(dim_overlay(150), (0, 0))
+            draw_text("PAUSED", FONT_LARGE, WHITE, WIDTH // 2, HEIGHT // 2, center=True)
+            renderer.capture()
+        header.draw(state, hovered)
+        return
     
-    draw_text("GAME OVER", FONT_LARGE, RED, WIDTH // 2, HEIGHT // 2 - 150, center=True)
+    if renderer.begin("game"):
+        screen.blit(assets.image("sky"), (0, 0))
+        draw_header_bar()
+        renderer.capture()
     
-    y_offset = HEIGHT // 2 - 80
-    draw_text(f"Player: {state.player_name}", FONT_MEDIUM, BLACK, WIDTH // 2, y_offset, center=True)
-    draw_text(f"Final Score: {state.score}", FONT_MEDIUM, BLACK, WIDTH // 2, y_offset + 50, center=True)
-    draw_text(f"Final Level: {state.level}", FONT_MEDIUM, BLACK, WIDTH // 2, y_offset + 100, center=True)
+    # Header buttons
+    header.draw(state, hovered)
     
-    # Buttons
-    play_again_btn = pygame.Rect(WIDTH // 2 - 220, HEIGHT // 2 + 50, 200, 50)
-    main_menu_btn = pygame.Rect(WIDTH // 2 + 20, HEIGHT // 2 + 50, 200, 50)
+    # Everything below moves, so it is erased and redrawn every frame
+    renderer.clear_volatile()
+    renderer.track(draw_hud(state, time_left))
     
-    if draw_button("Play Again", play_again_btn, GREEN, (100, 255, 100), BLACK):
-        state.reset()
-        state.play_music("game")
-        game_start_time = pygame.time.get_ticks()  # Reset timer
-        return "game"
-    if draw_button("Main Menu", main_menu_btn, RED, (255, 100, 100), WHITE):
-        state.reset()
-        state.play_music("menu")
-        return "start"
+    # Draw balloons (under the header)
+    screen.set_clip(PLAY_AREA)
+    renderer.track(draw_balloons(state.balloons))
+    if governor.particles:
+        renderer.track(state.particles.draw(screen))
+    screen.set_clip(None)
+
+# Headless simulation
+class Simulation:
+    """Game logic only: fixed 60 Hz timestep, seeded RNG, no display or sound."""
+    FRAME_MS = 1000 / 60
+    TUNABLE = ("balloon_count", "target_balloons", "target_increase")
+
+    def __init__(self, difficulty="medium", seed=None, clicks=None, total_time=30000, tuning=None):
+        self.state = GameState(seed=seed, score_store=MemoryScoreStore())
+        self.state.sound_enabled = False
+        self.state.current_difficulty = difficulty
+        tuning = tuning or {}  # Difficulty speeds and TUNABLE values to override
+        settings = DIFFICULTIES[difficulty]
+        if any(name in tuning for name in settings):
+            self.state.custom_difficulty = {name: tuning.get(name, value) for name, value in settings.items()}
+        for name in self.TUNABLE:
+            if name in tuning:
+                setattr(self.state, name, tuning[name])
+        self.clicks = clicks  # (state, frame) -> [(x, y)], or {frame: [(x, y)]}
+        self.total_time = total_time
+        self.frame = 0
+        self.current_screen = "game"
+        self.escaped = 0
+        self.escaped_by_level = []  # Index 0 is level 1
+        self.click_count = 0
     
-    return "game_over"
+    def step(self, clicks=None):
+        state = self.state
+        if clicks is None and self.clicks is not None:
+            if callable(self.clicks):
+                clicks = self.clicks(state, self.frame)
+            else:
+                clicks = self.clicks.get(self.frame)
+        if clicks and not state.paused:
+            self.click_count += len(clicks)
+            pop_balloons(state, clicks)
+        if not state.paused:
+            level = state.level  # Balloons escape before a level up
+            self.current_screen = update_game(state, self.frame * self.FRAME_MS, self.total_time)
+            self.escaped += state.balloons.escaped
+            while len(self.escaped_by_level) < level:
+                self.escaped_by_level.append(0)
+            self.escaped_by_level[level - 1] += state.balloons.escaped
+        self.frame += 1
+        return self.current_screen == "game"
+    
+    def run(self, max_frames=None):
+        while self.step():
+            if max_frames is not None and self.frame >= max_frames:
+                break
+        return self.result()
+    
+    def result(self):
+        return {
+            "difficulty": self.state.current_difficulty,
+            "frames": self.frame,
+            "score": self.state.score,
+            "level": self.state.level,
+            "clicks": self.click_count,
+            "escaped": self.escaped,
+            "escaped_by_level": self.escaped_by_level
+        }
+
+def click_bot(clicks_per_second=4, accuracy=0.9, seed=None):
+    # Simple player model: clicks a random poppable balloon at a steady rate
+    # and misses (clicks empty space next to it) with probability 1 - accuracy.
+    rng = np.random.default_rng(seed)
+    interval = 60 / clicks_per_second
+    next_click = [interval]
+
+    def clicks(state, frame):
+        if frame < next_click[0]:
+            return ()
+        next_click[0] += interval
+        balloons = state.balloons
+        n = balloons.count
+        targets = np.flatnonzero(balloons.alive[:n] & (balloons.y[:n] > HEADER_HEIGHT)
+                                 & (balloons.y[:n] < HEIGHT - px(40)))
+        if not len(targets):
+            return ()
+        i = targets[rng.integers(len(targets))]
+        x = balloons.x[i] + balloons.w[i] / 2
+        y = balloons.y[i] + balloons.h[i] / 2
+        if rng.random() >= accuracy:
+            x += balloons.w[i]
+        return [(float(x), float(y))]
+
+    return clicks
+
+def draw_game_over_background(state):
+    # Drawn over the last game frame, kept when the game ended
+    backdrop = renderer.backdrops.get("game_over")
+    if backdrop is not None:
+        screen.blit(backdrop, (0, 0))
+    else:  # Replay snapshot taken on this screen
+        screen.blit(assets.image("sky"), (0, 0))
+        draw_header_bar()
+    screen.blit(dim_overlay(180), (0, 0))
+    
+    box_rect = pygame.Rect(WIDTH // 2 - px(250), HEIGHT // 2 - px(200), px(500), px(400))
+    pygame.draw.rect(screen, WHITE, box_rect, border_radius=px(20))
+    pygame.draw.rect(screen, BLACK, box_rect, px(3), border_radius=px(20))
+    
+    draw_text("GAME OVER", FONT_LARGE, RED, WIDTH // 2, HEIGHT // 2 - px(150), center=True)
+    
+    y_offset = HEIGHT // 2 - px(80)
+    draw_text(f"Player: {state.player_name}", FONT_MEDIUM, BLACK, WIDTH // 2, y_offset, center=True)
+    draw_text(f"Final Score: {state.score}", FONT_MEDIUM, BLACK, WIDTH // 2, y_offset + px(50), center=True)
+    draw_text(f"Final Level: {state.level}", FONT_MEDIUM, BLACK, WIDTH // 2, y_offset + px(100), center=True)
+    if state.rank is not None:
+        draw_text(f"High score rank: #{state.rank}", FONT_SMALL, BLACK, WIDTH // 2, HEIGHT // 2 + px(150),
+                  center=True)
+
+def play_again(state):
+    state.reset()
+    state.play_music("game")
+    return "game"
+
+def main_menu(state):
+    state.reset()
+    state.play_music("menu")
+    return "start"
+
+# Every screen but the game itself, whose header is its only UI
+pages = {page.name: page for page in (
+    Page("name_input", [
+        NameField(pygame.Rect(WIDTH // 2 - px(200), px(250), px(400), px(60))),
+        Button("Submit", pygame.Rect(WIDTH // 2 - px(100), px(350), px(200), px(50)),
+               GREEN, (100, 255, 100), BLACK, on_click=submit_name)
+    ], draw_name_input_background),
+    Page("manual", [
+        Button("Continue", pygame.Rect(WIDTH // 2 - px(100), HEIGHT - px(100), px(200), px(50)),
+               GREEN, (100, 255, 100), BLACK, on_click=lambda state: "start")
+    ], draw_manual_background),
+    Page("start", [
+        difficulty_button("easy", 250, GREEN, (100, 255, 100), BLACK),
+        difficulty_button("medium", 320, BLUE, (100, 100, 255), WHITE),
+        difficulty_button("hard", 390, RED, (255, 100, 100), WHITE),
+        Button("Start Game", pygame.Rect(WIDTH // 2 - px(150), px(470), px(300), px(60)),
+               (100, 100, 255), (150, 150, 255), on_click=start_game),
+        Button("High Scores", pygame.Rect(WIDTH // 2 - px(150), px(550), px(300), px(60)),
+               (255, 165, 0), (255, 200, 0), on_click=lambda state: "scores")
+    ], draw_start_background, on_enter=lambda state: state.play_music("menu")),
+    Page("scores", [
+        Button("Back", pygame.Rect(WIDTH // 2 - px(100), HEIGHT - px(100), px(200), px(50)),
+               RED, (255, 100, 100), on_click=lambda state: "start")
+    ], draw_scores_background, signature=scores_table),
+    Page("game_over", [
+        Button("Play Again", pygame.Rect(WIDTH // 2 - px(220), HEIGHT // 2 + px(50), px(200), px(50)),
+               GREEN, (100, 255, 100), BLACK, on_click=play_again),
+        Button("Main Menu", pygame.Rect(WIDTH // 2 + px(20), HEIGHT // 2 + px(50), px(200), px(50)),
+               RED, (255, 100, 100), WHITE, on_click=main_menu)
+    ], draw_game_over_background,
+        signature=lambda state: (state.player_id, state.player_name, state.score, state.level, state.rank)),
+    header
+)}
+
+# Instrumentation
+class Profiler:
+    """Frame profiler: scoped phase timers, an on-screen overlay and Chrome trace export."""
+    HOT_FUNCTIONS = ("draw_text", "draw_balloons", "create_balloons", "pop_effect", "update_game",
+                     "draw_game_screen", "Page.draw", "Page.handle")
+    PHASES = ("events", "dispatch", "flip", "tick")
+    HISTORY = 240  # Frames shown in the overlay graph
+    OVERLAY_RECT = pygame.Rect(px(10), HEIGHT - px(226), px(300), px(216))
+
+    def __init__(self, max_events=500000):
+        self.enabled = False
+        self.overlay = False
+        self.trace_path = None
+        self.origin = time.perf_counter()
+        self.events = deque(maxlen=max_events)  # (name, start, duration) in seconds
+        self.frame_times = deque(maxlen=self.HISTORY)
+        self.phases = {}
+        self.last_phases = {}
+        self.frame_start = None
+        self.originals = {}
+        self.font = None
+        self._null = nullcontext()
+
+    def enable(self):
+        if self.enabled:
+            return
+        self.enabled = True
+        for name in self.HOT_FUNCTIONS:
+            owner, attribute = self._target(name)
+            self.originals[name] = getattr(owner, attribute)
+            setattr(owner, attribute, self._wrap(name, self.originals[name]))
+
+    def disable(self):
+        if not self.enabled:
+            return
+        for name, function in self.originals.items():
+            setattr(*self._target(name), function)
+        self.originals.clear()
+        self.enabled = False
+        self.frame_start = None
+
+    def toggle_overlay(self):
+        self.overlay = not self.overlay
+        if self.overlay:
+            self.enable()
+        elif self.trace_path is None:
+            self.disable()  # Nothing left to record for, so drop the timing wrappers
+        renderer.redraw()  # Clear the overlay or draw the screen under it
+
+    @staticmethod
+    def _target(name):
+        # (object holding the function, attribute name)
+        if "." in name:
+            owner, attribute = name.split(".")
+            return globals()[owner], attribute
+        return sys.modules[__name__], name
+
+    def _wrap(self, name, function):
+        record = self.events.append
+        clock = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record((name, start, clock() - start))
+        timed.__wrapped__ = function
+        return timed
+
+    def scope(self, name):
+        if not self.enabled:
+            return self._null
+        return _ProfileScope(self, name)
+
+    def record(self, name, start, duration):
+        self.events.append((name, start, duration))
+        self.phases[name] = self.phases.get(name, 0.0) + duration
+
+    def next_frame(self):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self.frame_start is not None:
+            self.frame_times.append(now - self.frame_start)
+            self.events.append(("frame", self.frame_start, now - self.frame_start))
+        self.frame_start = now
+        self.last_phases, self.phases = self.phases, {}
+
+    def draw_overlay(self, surface, state):
+        if not self.overlay:
+            return
+        if self.font is None:
+            self.font = pygame.font.SysFont("Arial", px(14), bold=True)
+        rect = self.OVERLAY_RECT
+        pygame.draw.rect(surface, (20, 20, 20), rect)
+        pygame.draw.rect(surface, GRAY, rect, 1)
+
+        # Frame-time graph, 0-33 ms, with the 60 fps budget marked
+        graph = pygame.Rect(rect.x + px(5), rect.y + px(5), rect.width - px(10), px(70))
+        budget_y = graph.bottom - int(graph.height * 16.7 / 33.3)
+        pygame.draw.line(surface, DARK_GRAY, (graph.x, budget_y), (graph.right, budget_y))
+        if len(self.frame_times) > 1:
+            step = graph.width / (self.HISTORY - 1)
+            points = [(graph.x + i * step, graph.bottom - min(graph.height, graph.height * t / 0.0333))
+                      for i, t in enumerate(self.frame_times)]
+            pygame.draw.lines(surface, GREEN, False, points)
+
+        frame_ms = self.frame_times[-1] * 1000 if self.frame_times else 0.0
+        lines = [f"frame {frame_ms:5.1f} ms   balloons {len(state.balloons)}   particles {state.particles.live_count()}",
+                 f"quality: {governor.LEVELS[governor.level]}"]
+        if audio.enabled:
+            metrics = audio.metrics()
+            lines.append(f"sfx {metrics['sfx_decoded_bytes'] // 1024} KB  busy {metrics['sfx_voices_busy']}"
+                         f"  stolen {metrics['sfx_voices_stolen']}  dropped {metrics['sfx_dropped']}")
+        lines += [f"{name:<10}{self.last_phases.get(name, 0.0) * 1000:6.2f} ms" for name in self.PHASES]
+        y = graph.bottom + px(5)
+        for line in lines:
+            surface.blit(self.font.render(line, True, WHITE), (rect.x + px(8), y))
+            y += px(18)
+        renderer.dirty.append(rect)
+
+    def export(self, path=None):
+        # Chrome trace format: load in chrome://tracing or ui.perfetto.dev
+        path = path or self.trace_path
+        if not path or not self.events:
+            return None
+        trace = [{"name": name, "ph": "X", "pid": 0, "tid": 0,
+                  "ts": (start - self.origin) * 1e6, "dur": duration * 1e6}
+                 for name, start, duration in self.events]
+        with open(path, 'w') as file:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, file)
+        return path
+
+class _ProfileScope:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.start, time.perf_counter() - self.start)
+        return False
+
+profiler = Profiler()
 
 # Main game loop
-def main():
-    clock = pygame.time.Clock()
-    state = GameState()
-    current_screen = "name_input"  # Start with name input
-    game_start_time = 0
-    total_game_time = 30000  # 30 seconds
+class Game:
+    """One running session: the game state plus which screen is showing."""
+
+    def __init__(self, state=None):
+        self.state = GameState() if state is None else state
+        self.current_screen = None
+        self.pointer = (0, 0)  # Last known mouse position
+        self.hovered = None  # Index of the widget under the pointer on the current page
+        self.pressed = None  # Index of the widget the mouse button went down on
+        self.game_start_time = 0
+        self.elapsed_time = 0
+        self.total_game_time = 30000  # 30 seconds
+        self.running = True
+        self.clicks = []
+        self.last_update = None
+        self.switch("name_input")  # Start with name input
+    
+    def switch(self, screen):
+        if screen == self.current_screen:
+            return
+        if screen == "game":
+            self.game_start_time = 0  # Restart the timer on every new game
+        if screen == "game_over":
+            renderer.keep_backdrop(screen)
+        if self.current_screen == "game":
+            audio.duck_music(False)  # Skipping while paused would leave it ducked
+        self.current_screen = screen
+        pages[screen].enter(self)
     
-    running = True
-    while running:
-        for event in pygame.event.get():
+    def handle_events(self, events):
+        state = self.state
+        for event in events:
+            if event.type in (pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP):
+                self.pointer = event.pos
+                screen = pages[self.current_screen].handle(event, self)
+                if screen is not None:
+                    self.switch(screen)
             if event.type == pygame.QUIT:
-                running = False
+                self.running = False
             elif event.type == pygame.MOUSEBUTTONDOWN:
-                if current_screen == "game":
+                if self.current_screen == "game":
                     if not state.paused:
-                        for balloon in state.balloons[:]:
-                            if balloon["rect"].collidepoint(event.pos) and balloon["rect"].y > 60:  # Only pop balloons below header
-                                balloon["popped"] = True
-                                state.balloons.remove(balloon)
-                                state.score += 1
-                                state.balloons_popped += 1
-                                pop_effect(event.pos[0], event.pos[1], state)
-                elif current_screen == "name_input":
+                        self.clicks.append(event.pos)
+                elif self.current_screen == "name_input":
                     # Activate text input
                     state.name_input_active = True
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                profiler.toggle_overlay()
             elif event.type == pygame.KEYDOWN and state.name_input_active:
                 if event.key == pygame.K_RETURN:
                     state.name_input_active = False
@@ -487,36 +1970,503 @@ def main():
                     # Limit name length and only allow certain characters
                     if len(state.player_name) < 15 and event.unicode.isalnum():
                         state.player_name += event.unicode
-        
-        # Screen transitions
-        if current_screen == "name_input":
-            current_screen = draw_name_input_screen(state)
-        elif current_screen == "manual":
-            current_screen = draw_manual_screen(state)
-        elif current_screen == "start":
-            current_screen = draw_start_screen(state)
-        elif current_screen == "scores":
-            current_screen = draw_scores_screen(state)
-        elif current_screen == "game":
-            if game_start_time == 0:  # First frame of game
-                game_start_time = pygame.time.get_ticks()
-            elapsed_time = pygame.time.get_ticks() - game_start_time
-            current_screen = draw_game_screen(state, elapsed_time, total_game_time)
-        elif current_screen == "game_over":
+    
+    def update(self, now):
+        state = self.state
+        # Real time since the last frame, capped so a stall doesn't teleport balloons
+        frame_time = 1000 / 60 if self.last_update is None else min(max(now - self.last_update, 0), 100)
+        self.last_update = now
+        if state.sound_enabled:
+            audio.update(frame_time)
+        if self.current_screen == "game":
+            if self.game_start_time == 0:  # First frame of game
+                self.game_start_time = now
+            self.elapsed_time = now - self.game_start_time
+            # Pop balloons for every click in this frame's event batch
+            if self.clicks:
+                pop_balloons(state, self.clicks)
+            self.switch(update_game(state, self.elapsed_time, self.total_game_time, frame_time))
+        elif self.current_screen == "game_over":
             if state.game_over:
                 state.add_score()
                 state.game_over = False
-            result = draw_game_over_screen(state)
-            if result == "game":
-                game_start_time = pygame.time.get_ticks()
-                current_screen = "game"
-            elif result == "start":
-                current_screen = "start"
-        
-        pygame.display.flip()
-        clock.tick(60)
+        if state.score_store.poll():
+            state.load_scores()  # A background save finished
+        self.clicks.clear()
+    
+    def draw(self):
+        if self.current_screen == "game":
+            draw_game_screen(self.state, self.elapsed_time, self.total_game_time, self.hovered)
+        else:
+            pages[self.current_screen].draw(self.state, self.hovered)
+    
+    def frame(self, events, now):
+        self.handle_events(events)
+        self.update(now)
+        self.draw()
+
+# Session recording and replay
+# Header: magic, version, seed, start ticks, resolution (version 2: none, 800x700). Each frame is a
+# flags byte plus what changed: 0x01 frame ms (varint), 0x02 mouse position (two uint16), 0x04 events
+# (count, then type byte and fields each). A final 0x80 record holds the state digest and frame count.
+RECORDING_MAGIC = b"BPR1"
+RECORDING_VERSION = 3
+RECORDING_HEADER = struct.Struct("<4sBQI")  # Followed by the resolution as a POINT
+RECORDING_END = struct.Struct("<8sI")
+POINT = struct.Struct("<HH")
+EVENT_QUIT, EVENT_PRESS, EVENT_KEY, EVENT_RELEASE = 1, 2, 3, 4
+
+def _write_varint(out, value):
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _read_varint(data, offset):
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+def _clamp_point(pos):
+    return tuple(min(max(int(v), 0), 0xFFFF) for v in pos)
+
+def state_digest(game):
+    # Everything a replay has to reproduce: screen, score, balloons and RNG position
+    state = game.state
+    balloons = state.balloons
+    n = balloons.count
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(json.dumps([game.current_screen, state.player_name, state.current_difficulty,
+                              state.score, state.level, state.balloons_popped,
+                              state.target_balloons]).encode())
+    digest.update(repr(state.rng.bit_generator.state).encode())
+    for array in (balloons.x, balloons.y, balloons.w, balloons.h, balloons.alive):
+        digest.update(array[:n].tobytes())
+    return digest.digest()
+
+class SessionRecorder:
+    """Appends what main() feeds the game each frame to a recording file."""
+    FLUSH_EVERY = 60  # Frames buffered between writes
+
+    def __init__(self, path, seed, start_ticks):
+        self.path = path
+        self.file = open(path, "ab")
+        self.file.write(RECORDING_HEADER.pack(RECORDING_MAGIC, RECORDING_VERSION, seed, start_ticks))
+        self.file.write(POINT.pack(WIDTH, HEIGHT))
+        self.buffer = bytearray()
+        self.ticks = start_ticks
+        self.frame_time = None
+        self.frames = 0
+
+    def frame(self, now, events):
+        out = self.buffer
+        flags_at = len(out)
+        out.append(0)
+        flags = 0
+        frame_time, self.ticks = now - self.ticks, now
+        if frame_time != self.frame_time:
+            flags |= 0x01
+            _write_varint(out, frame_time)
+            self.frame_time = frame_time
+        # Only hover depends on motion, so one position per frame is enough
+        moved = None
+        for event in events:
+            if event.type == pygame.MOUSEMOTION:
+                moved = event.pos
+        if moved is not None:
+            flags |= 0x02
+            out += POINT.pack(*_clamp_point(moved))
+        # Of the rest, only the events Game.handle_events() acts on are kept
+        kept = [event for event in events
+                if event.type in (pygame.QUIT, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP, pygame.KEYDOWN)]
+        if kept:
+            flags |= 0x04
+            _write_varint(out, len(kept))
+            for event in kept:
+                if event.type == pygame.QUIT:
+                    out.append(EVENT_QUIT)
+                elif event.type in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP):
+                    out.append(EVENT_PRESS if event.type == pygame.MOUSEBUTTONDOWN else EVENT_RELEASE)
+                    out += POINT.pack(*_clamp_point(event.pos))
+                    out.append(event.button & 0xFF)
+                else:
+                    text = event.unicode.encode("utf-8")
+                    out.append(EVENT_KEY)
+                    _write_varint(out, event.key)
+                    _write_varint(out, len(text))
+                    out += text
+        out[flags_at] = flags
+        self.frames += 1
+        if self.frames % self.FLUSH_EVERY == 0:
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.buffer)
+        self.file.flush()
+        self.buffer.clear()
+
+    def close(self, game):
+        self.buffer.append(0x80)
+        self.buffer += RECORDING_END.pack(state_digest(game), self.frames)
+        self.flush()
+        self.file.close()
+
+class Recording:
+    """A decoded recording: frames are (frame_time, events) as handed to the game."""
+
+    def __init__(self, seed, start_ticks, size=(DESIGN_WIDTH, DESIGN_HEIGHT)):
+        self.seed = seed
+        self.start_ticks = start_ticks
+        self.size = size  # Internal resolution the game ran at
+        self.frames = []
+        self.digest = None  # None if the session never finished (crash or truncated file)
+
+def read_recording(path):
+    with open(path, "rb") as file:
+        data = file.read()
+    magic, version, seed, start_ticks = RECORDING_HEADER.unpack_from(data)
+    if magic != RECORDING_MAGIC or version not in (2, RECORDING_VERSION):
+        raise ValueError(f"{path} is not a Balloon Pop recording")
+    offset = RECORDING_HEADER.size
+    if version == 2:
+        recording = Recording(seed, start_ticks)
+    else:
+        recording = Recording(seed, start_ticks, POINT.unpack_from(data, offset))
+        offset += POINT.size
+    frame_time = 0
+    try:
+        while offset < len(data):
+            flags = data[offset]
+            offset += 1
+            if flags & 0x80:
+                recording.digest = RECORDING_END.unpack_from(data, offset)[0]
+                break
+            if flags & 0x01:
+                frame_time, offset = _read_varint(data, offset)
+            events = []
+            if flags & 0x02:
+                events.append(pygame.event.Event(pygame.MOUSEMOTION, pos=POINT.unpack_from(data, offset)))
+                offset += POINT.size
+            if flags & 0x04:
+                count, offset = _read_varint(data, offset)
+                for _ in range(count):
+                    kind = data[offset]
+                    offset += 1
+                    if kind == EVENT_QUIT:
+                        events.append(pygame.event.Event(pygame.QUIT))
+                    elif kind in (EVENT_PRESS, EVENT_RELEASE):
+                        x, y = POINT.unpack_from(data, offset)
+                        button = data[offset + POINT.size]
+                        offset += POINT.size + 1
+                        event_type = pygame.MOUSEBUTTONDOWN if kind == EVENT_PRESS else pygame.MOUSEBUTTONUP
+                        events.append(pygame.event.Event(event_type, pos=(x, y), button=button))
+                    else:
+                        key, offset = _read_varint(data, offset)
+                        length, offset = _read_varint(data, offset)
+                        if offset + length > len(data):
+                            raise IndexError("truncated key event")
+                        text = data[offset:offset + length].decode("utf-8")
+                        offset += length
+                        events.append(pygame.event.Event(pygame.KEYDOWN, key=key, unicode=text, mod=0))
+            recording.frames.append((frame_time, events))
+    except (IndexError, struct.error, UnicodeDecodeError):
+        pass  # Truncated last record; everything before it is still good
+    return recording
+
+class Replay:
+    """Re-runs a recording through Game, frame for frame, with sound off."""
+    SNAPSHOT_EVERY = 600  # 10 s at 60 fps
+    CHECK_SEEKS_EVERY = 150  # Frames between the points check_seeks() visits
+
+    def __init__(self, recording):
+        if recording.size != (WIDTH, HEIGHT):
+            width, height = recording.size
+            raise ValueError(f"Recorded at {width}x{height}, but this game runs at {WIDTH}x{HEIGHT}; "
+                             f"replay it with --render-scale {width / DESIGN_WIDTH:g}")
+        self.recording = recording
+        state = GameState(seed=recording.seed, score_store=MemoryScoreStore())
+        state.sound_enabled = False
+        self.game = Game(state)
+        self.frame = 0
+        self.now = recording.start_ticks
+        self.snapshots = {}  # frame -> (game, now), everything a frame's outcome depends on
+
+    def step(self):
+        if self.frame % self.SNAPSHOT_EVERY == 0 and self.frame not in self.snapshots:
+            self.snapshots[self.frame] = copy.deepcopy((self.game, self.now))
+        frame_time, events = self.recording.frames[self.frame]
+        self.now += frame_time
+        self.game.frame(events, self.now)
+        renderer.present()
+        self.frame += 1
+
+    def seek(self, frame):
+        frame = min(frame, len(self.recording.frames))
+        nearest = max((start for start in self.snapshots if start <= frame), default=None)
+        if nearest is not None and (frame < self.frame or nearest > self.frame):
+            self.game, self.now = copy.deepcopy(self.snapshots[nearest])
+            self.frame = nearest
+            renderer.redraw()
+        while self.frame < frame:
+            self.step()
 
+    def check_seeks(self):
+        # Frames where seeking backwards or forwards lands in another state than a straight replay
+        points = list(range(0, len(self.recording.frames), self.CHECK_SEEKS_EVERY)) + [len(self.recording.frames)]
+        self.seek(0)
+        expected = {}
+        for frame in points:
+            self.seek(frame)
+            expected[frame] = state_digest(self.game)
+        mismatches = set()
+        for frame in reversed(points):
+            self.seek(frame)
+            if state_digest(self.game) != expected[frame]:
+                mismatches.add(frame)
+        for frame in points:
+            self.seek(frame)
+            if state_digest(self.game) != expected[frame]:
+                mismatches.add(frame)
+        return sorted(mismatches)
+
+    def run(self, realtime=False):
+        frames = self.recording.frames
+        started = pygame.time.get_ticks() - self.now
+        while self.frame < len(frames):
+            self.step()
+            if realtime:
+                if any(event.type == pygame.QUIT for event in pygame.event.get()):
+                    break
+                assets.poll()
+                pygame.time.wait(max(0, started + self.now - pygame.time.get_ticks()))
+        return self.result()
+
+    def result(self):
+        state = self.game.state
+        finished = self.frame == len(self.recording.frames)
+        return {
+            "frames": self.frame,
+            "score": state.score,
+            "level": state.level,
+            "difficulty": state.current_difficulty,
+            "matches": (state_digest(self.game) == self.recording.digest
+                        if finished and self.recording.digest is not None else None)
+        }
+
+# Frame pacing
+class FramePacer:
+    """Decides how long to wait between frames; see STRATEGIES."""
+    STRATEGIES = {
+        "tick": "sleep after the flip to hold 60 fps (pygame Clock.tick)",
+        "busy": "like tick, but busy-wait for exact frame times (Clock.tick_busy_loop)",
+        "late": "sleep before reading input instead of after the flip, 60 fps",
+        "vsync": "vsynced window (SCALED); the flip waits for the display",
+        "uncapped": "no waiting at all",
+    }
+    FPS = 60
+    MARGIN_MS = 1.0  # Slack left on top of the expected frame work in late mode
+
+    def __init__(self, strategy="tick"):
+        self.strategy = strategy
+        self.vsync = strategy == "vsync"
+        self.clock = pygame.time.Clock()
+        self.frame_start = time.perf_counter()
+        self.deadline = self.frame_start
+        self.recent_work = deque(maxlen=self.FPS)  # Seconds
+        self.present_wait = 0.0  # Seconds this frame's present spent blocked on vsync
+
+    def present(self):
+        start = time.perf_counter()
+        renderer.present()
+        if self.vsync:
+            self.present_wait = time.perf_counter() - start
+
+    def end_frame(self):
+        # Waits as the strategy says; returns this frame's work time in ms,
+        # leaving out waiting for vsync, which is pacing rather than work
+        work = time.perf_counter() - self.frame_start - self.present_wait
+        self.present_wait = 0.0
+        if self.strategy == "tick":
+            self.clock.tick(self.FPS)
+        elif self.strategy == "busy":
+            self.clock.tick_busy_loop(self.FPS)
+        elif self.strategy == "late":
+            self.recent_work.append(work)
+            self.deadline += 1 / self.FPS
+            budget = max(self.recent_work) + self.MARGIN_MS / 1000
+            now = time.perf_counter()
+            if self.deadline - budget > now:
+                time.sleep(self.deadline - budget - now)
+            else:
+                self.deadline = now + budget  # Running behind; start again from now
+        self.frame_start = time.perf_counter()
+        return work * 1000
+
+class LatencyMeter:
+    """Click-to-screen latency while playing, bounded by the event drains around each click."""
+
+    def __init__(self):
+        self.enabled = False
+        self.last_drain = None
+        self.pending = []  # (drain, previous drain) per click
+        self.samples = []  # (from drain, from previous drain) in seconds
+
+    def drained(self, events, playing):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        previous, self.last_drain = self.last_drain, now
+        if playing and previous is not None:
+            for event in events:
+                if event.type == pygame.MOUSEBUTTONDOWN:
+                    self.pending.append((now, previous))
+
+    def presented(self):
+        if self.pending:
+            now = time.perf_counter()
+            self.samples.extend((now - drain, now - previous) for drain, previous in self.pending)
+            self.pending.clear()
+
+    def report(self):
+        report = {"clicks": len(self.samples)}
+        if self.samples:
+            samples_ms = np.array(self.samples) * 1000
+            for column, name in enumerate(("from_drain_ms", "from_previous_drain_ms")):
+                p50, p95, p99 = np.percentile(samples_ms[:, column], [50, 95, 99])
+                report[name] = {"mean": float(samples_ms[:, column].mean()), "p50": float(p50),
+                                "p95": float(p95), "p99": float(p99), "max": float(samples_ms[:, column].max())}
+        return report
+
+latency = LatencyMeter()
+
+def main(record_dir=None, pacing="tick", **display):
+    # display: window_size, scaled and fullscreen, as init_display() takes them
+    pacer = FramePacer(pacing)
+    init_display(vsync=pacer.vsync, **display)
+    assets.start()
+    seed = int.from_bytes(os.urandom(8), "little")
+    game = Game(GameState(seed=seed))
+    recorder = None
+    if record_dir:
+        os.makedirs(record_dir, exist_ok=True)
+        name = datetime.now().strftime("session-%Y%m%d-%H%M%S") + f"-{seed:016x}.bpr"
+        recorder = SessionRecorder(os.path.join(record_dir, name), seed, pygame.time.get_ticks())
+    
+    while game.running:
+        profiler.next_frame()
+        assets.poll()
+        with profiler.scope("events"):
+            now = pygame.time.get_ticks()
+            events = viewport.to_game(pygame.event.get())
+            latency.drained(events, game.current_screen == "game")
+            if recorder:
+                recorder.frame(now, events)
+            game.handle_events(events)
+        with profiler.scope("dispatch"):
+            game.update(now)
+            game.draw()
+        profiler.draw_overlay(screen, game.state)
+        with profiler.scope("flip"):
+            pacer.present()
+        latency.presented()
+        if assets.first_frame_ms is None:
+            assets.first_frame()
+            balloon_atlas.build()  # Avoid hitches the first time each balloon appears
+        with profiler.scope("tick"):
+            work_ms = pacer.end_frame()
+        governor.update(work_ms)
+
+    if recorder:
+        recorder.close(game)
+    game.state.score_store.close()  # Waits for scores still being saved
+    profiler.export()
     pygame.quit()
 
+def window_size(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Balloon Pop")
+    parser.add_argument("--simulate", type=int, metavar="GAMES",
+                        help="play GAMES headless bot games and print their results as JSON lines")
+    parser.add_argument("--seed", type=int, default=0, help="RNG seed for the first simulated game")
+    parser.add_argument("--difficulty", choices=list(DIFFICULTIES), default="medium")
+    parser.add_argument("--full-redraw", action="store_true",
+                        help="redraw and flip the whole screen every frame instead of only what changed")
+    parser.add_argument("--profile", nargs="?", const="balloonpop-trace.json", metavar="TRACE",
+                        help="profile every frame and write a Chrome trace to TRACE on exit "
+                             "(F3 toggles the profiler overlay at any time)")
+    parser.add_argument("--fixed-quality", action="store_true",
+                        help="never lower visual quality to hold the frame rate")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="print time to first frame and to all assets loaded on exit")
+    parser.add_argument("--render-scale", type=render_scale, default=RENDER_SCALE, metavar="SCALE",
+                        help=f"draw at SCALE times {DESIGN_WIDTH}x{DESIGN_HEIGHT} and scale that to the window, "
+                             f"e.g. 0.5 to save fill rate or 2 for large displays "
+                             f"({MIN_RENDER_SCALE:g}-{MAX_RENDER_SCALE:g}; default: $BALLOONPOP_RENDER_SCALE or 1)")
+    parser.add_argument("--window", type=window_size, metavar="WxH",
+                        help=f"window size (default: {DESIGN_WIDTH}x{DESIGN_HEIGHT})")
+    parser.add_argument("--fullscreen", action="store_true", help="fill the display")
+    parser.add_argument("--scaled", action="store_true",
+                        help="let SDL scale to the window on the GPU (pygame.SCALED) instead of scaling in software; "
+                             "SDL picks the window size")
+    parser.add_argument("--pacing", choices=list(FramePacer.STRATEGIES), default="tick",
+                        help="frame pacing: " + "; ".join(f"{name}: {text}"
+                                                          for name, text in FramePacer.STRATEGIES.items()))
+    parser.add_argument("--latency", action="store_true",
+                        help="time clicks from input to screen and print the distribution on exit")
+    parser.add_argument("--record", metavar="DIR",
+                        help="record the session (input, seed and frame times) to a new file in DIR")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="re-run a recorded session headless as fast as possible and print the result")
+    parser.add_argument("--realtime", action="store_true",
+                        help="with --replay, show the replay in a window at its recorded speed")
+    parser.add_argument("--seek", type=int, default=0, metavar="FRAME",
+                        help="with --replay, skip ahead to FRAME before playing")
+    parser.add_argument("--check-seeks", action="store_true",
+                        help="with --replay, check that seeking back and forth reproduces the straight replay "
+                             "(exits 1 if not)")
+    args = parser.parse_args()
+    renderer.dirty_rects = not args.full_redraw
+    governor.enabled = not args.fixed_quality
+    if args.profile:
+        profiler.trace_path = args.profile
+        profiler.enable()
+    if args.replay:
+        if not args.realtime:
+            os.environ["SDL_VIDEODRIVER"] = "dummy"
+            pygame.display.quit()
+            pygame.display.init()
+            init_display(window_size=(WIDTH, HEIGHT))  # Nothing is shown, so don't scale
+        else:
+            init_display(args.window, args.scaled, args.fullscreen)
+        if args.realtime:
+            assets.start()
+        replay = Replay(read_recording(args.replay))
+        if args.check_seeks:
+            mismatches = replay.check_seeks()
+            print(json.dumps({"frames": len(replay.recording.frames), "seek_mismatches": mismatches}))
+            pygame.quit()
+            sys.exit(1 if mismatches else 0)
+        replay.seek(args.seek)
+        print(json.dumps(dict(replay.run(args.realtime), seed=replay.recording.seed)))
+        pygame.quit()
+    elif args.simulate:
+        for game in range(args.simulate):
+            seed = args.seed + game
+            simulation = Simulation(args.difficulty, seed=seed, clicks=click_bot(seed=seed))
+            print(json.dumps(dict(simulation.run(), seed=seed)))
+    else:
+        latency.enabled = args.latency
+        main(args.record, args.pacing, window_size=args.window, scaled=args.scaled, fullscreen=args.fullscreen)
+        if args.startup_report:
+            print(json.dumps(assets.report()))
+        if args.latency:
+            print(json.dumps(dict(latency.report(), pacing=args.pacing)))
\ No newline at end of file
@@ -0,0 +1,240 @@
+"""Frame-time benchmarks for Balloon Pop.
+
+Drives the real Game event/update/draw path plus display flip through a set
+of scripted load scenarios and reports per-phase frame times. Runs headless
+(SDL dummy video and audio drivers), so it works on a CI box with no GPU.
+
+    python benchmark.py                      # all scenarios, table to stdout
+    python benchmark.py --json results.json  # also write machine-readable results
+    python benchmark.py --scenario game_level_50 --frames 1000
+    python benchmark.py --alloc-budget 4       # exit 1 if a steady-state frame allocates more
+    BALLOONPOP_RENDER_SCALE=0.5 python benchmark.py   # at half the internal resolution
+"""
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pygame
+
+import balloonPop as bp
+
+PHASES = ("events", "update", "draw", "flip")
+FRAME_MS = 1000 / 60
+
+
+# Scenarios: each sets up a Game and returns a per-frame event generator
+def menu_idle(game, level):
+    game.switch("start")
+    return lambda frame: ()
+
+def scores_table(entries):
+    def setup(game, level):
+        rng = np.random.default_rng(0)
+        game.state.score_store.add_many([{
+            "player_id": str(i),
+            "name": f"Player{i}",
+            "score": int(score),
+            "level": int(score) // 20 + 1,
+            "difficulty": "medium",
+            "timestamp": "2025-01-01 00:00:00"
+        } for i, score in enumerate(rng.integers(0, 500, entries))])
+        game.state.load_scores()
+        game.switch("scores")
+        return lambda frame: ()
+    return setup
+
+def start_game(game, level):
+    state = game.state
+    state.level = level
+    state.target_balloons = 10 ** 9  # Stay on this level for the whole run
+    game.switch("game")
+    game.total_game_time = 10 ** 9
+    # Fill the screen with the steady-state balloon count for the level,
+    # spread over the play area rather than all queued below it.
+    count = state.balloon_count + level * 2
+    bp.create_balloons(state, count)
+    state.balloons.y[:count] = state.rng.uniform(bp.HEADER_HEIGHT + 1, bp.HEIGHT, count)
+
+def game_level(game, level):
+    start_game(game, level)
+    return lambda frame: ()
+
+def pop_storm(clicks_per_frame):
+    def setup(game, level):
+        start_game(game, level)
+        balloons = game.state.balloons
+
+        def events(frame):
+            # Click the centres of the first visible balloons, as a burst of
+            # touches arriving in a single event drain.
+            n = balloons.count
+            visible = np.flatnonzero(balloons.alive[:n] & (balloons.y[:n] > bp.HEADER_HEIGHT)
+                                     & (balloons.y[:n] < bp.HEIGHT - bp.px(40)))
+            return [pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=1,
+                                       pos=(int(balloons.x[i] + balloons.w[i] // 2),
+                                            int(balloons.y[i] + balloons.h[i] // 2)))
+                    for i in visible[:clicks_per_frame]]
+        return events
+    return setup
+
+SCENARIOS = {
+    "menu_idle": (menu_idle, 1),
+    "scores_10": (scores_table(10), 1),
+    "scores_10000": (scores_table(10000), 1),
+    "game_level_1": (game_level, 1),
+    "game_level_10": (game_level, 10),
+    "game_level_50": (game_level, 50),
+    "pop_storm_level_10": (pop_storm(10), 10),
+    "pop_storm_level_50": (pop_storm(40), 50),
+}
+# Held to --alloc-budget. Pop storms are stress tests: every frame takes
+# clicks, so the score text, particle bursts and refills change each frame.
+STEADY_STATE = ("menu_idle", "scores_10", "scores_10000", "game_level_1", "game_level_10", "game_level_50")
+
+
+def make_game(name):
+    setup, level = SCENARIOS[name]
+    game = bp.Game(bp.GameState(seed=0, score_store=bp.MemoryScoreStore()))
+    game.state.sound_enabled = False
+    game.state.player_name = "Bench"
+    return game, setup(game, level)
+
+def run_frame(game, events, now, timings=None):
+    t0 = time.perf_counter()
+    for event in events:
+        pygame.event.post(event)
+    game.handle_events(pygame.event.get())
+    t1 = time.perf_counter()
+    game.update(now)
+    t2 = time.perf_counter()
+    game.draw()
+    t3 = time.perf_counter()
+    bp.renderer.present()
+    t4 = time.perf_counter()
+    if timings is not None:
+        timings.append((t1 - t0, t2 - t1, t3 - t2, t4 - t3))
+
+def percentiles(values_ms):
+    p50, p95, p99 = np.percentile(values_ms, [50, 95, 99])
+    return {"mean": float(np.mean(values_ms)), "p50": float(p50), "p95": float(p95),
+            "p99": float(p99), "max": float(np.max(values_ms))}
+
+def measure_allocations(name, frames, warmup):
+    # Separate pass: tracemalloc slows frames down too much to time them.
+    game, events = make_game(name)
+    for frame in range(warmup):
+        run_frame(game, events(frame), 1 + frame * FRAME_MS)
+    peak_bytes = []
+    net_blocks = []
+    tracemalloc.start()
+    try:
+        for frame in range(warmup, warmup + frames):
+            frame_events = events(frame)
+            tracemalloc.reset_peak()
+            current_before = tracemalloc.get_traced_memory()[0]
+            blocks_before = sys.getallocatedblocks()
+            run_frame(game, frame_events, 1 + frame * FRAME_MS)
+            net_blocks.append(sys.getallocatedblocks() - blocks_before)
+            peak_bytes.append(tracemalloc.get_traced_memory()[1] - current_before)
+    finally:
+        tracemalloc.stop()
+    return {
+        "transient_bytes_p50": float(np.percentile(peak_bytes, 50)),
+        "transient_bytes_max": int(max(peak_bytes)),
+        "net_blocks_mean": float(np.mean(net_blocks))
+    }
+
+def run_scenario(name, frames, warmup, allocations=True):
+    game, events = make_game(name)
+    for frame in range(warmup):
+        run_frame(game, events(frame), 1 + frame * FRAME_MS)
+    timings = []
+    for frame in range(warmup, warmup + frames):
+        run_frame(game, events(frame), 1 + frame * FRAME_MS, timings)
+
+    timings_ms = np.array(timings) * 1000
+    result = {
+        "frames": frames,
+        "balloons": len(game.state.balloons),
+        "frame_ms": percentiles(timings_ms.sum(axis=1)),
+        "phases_ms": {phase: percentiles(timings_ms[:, i]) for i, phase in enumerate(PHASES)},
+    }
+    if allocations:
+        result["allocations"] = measure_allocations(name, min(frames, 200), warmup)
+    return result
+
+def print_table(results):
+    print(f"{'scenario':<22}{'balloons':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          + "".join(f"{phase + ' p50':>12}" for phase in PHASES) + f"{'alloc KB':>10}{'alloc max':>11}")
+    for name, result in results.items():
+        frame = result["frame_ms"]
+        row = f"{name:<22}{result['balloons']:>9}{frame['p50']:>9.3f}{frame['p95']:>9.3f}{frame['p99']:>9.3f}"
+        row += "".join(f"{result['phases_ms'][phase]['p50']:>12.3f}" for phase in PHASES)
+        if "allocations" in result:
+            allocations = result["allocations"]
+            row += f"{allocations['transient_bytes_p50'] / 1024:>10.1f}{allocations['transient_bytes_max'] / 1024:>11.1f}"
+        print(row)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Balloon Pop frame-time benchmarks")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS),
+                        help="scenario to run (repeatable; default: all)")
+    parser.add_argument("--frames", type=int, default=600, help="measured frames per scenario")
+    parser.add_argument("--warmup", type=int, default=60, help="unmeasured frames before measuring")
+    parser.add_argument("--full-redraw", action="store_true", help="disable dirty-rectangle rendering")
+    parser.add_argument("--no-allocations", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--json", metavar="PATH", help="write results as JSON to PATH ('-' for stdout)")
+    parser.add_argument("--alloc-budget", type=float, metavar="KB",
+                        help="fail if any measured steady-state frame allocates more than KB (transient peak)")
+    args = parser.parse_args(argv)
+    if args.alloc_budget is not None and args.no_allocations:
+        parser.error("--alloc-budget needs the allocation pass")
+
+    bp.init_display()
+    bp.assets.wait()
+    bp.balloon_atlas.build()
+    bp.renderer.dirty_rects = not args.full_redraw
+    results = {}
+    for name in args.scenario or SCENARIOS:
+        results[name] = run_scenario(name, args.frames, args.warmup, not args.no_allocations)
+
+    report = {
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "video_driver": pygame.display.get_driver(),
+        "machine": platform.machine(),
+        "dirty_rects": bp.renderer.dirty_rects,
+        "render_scale": bp.RENDER_SCALE,
+        "scenarios": results
+    }
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print_table(results)
+        if args.json:
+            with open(args.json, "w") as file:
+                json.dump(report, file, indent=2)
+    pygame.quit()
+
+    if args.alloc_budget is not None:
+        # The worst frame, not the median: a hitch every few seconds is what the budget is for
+        over = {name: result["allocations"]["transient_bytes_max"] / 1024 for name, result in results.items()
+                if name in STEADY_STATE and result["allocations"]["transient_bytes_max"] > args.alloc_budget * 1024}
+        for name, kb in over.items():
+            print(f"{name}: {kb:.1f} KB in its worst frame, over the {args.alloc_budget:g} KB budget",
+                  file=sys.stderr)
+        return 1 if over else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
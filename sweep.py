@@ -0,0 +1,170 @@
+"""Parameter sweeps for tuning Balloon Pop's difficulty.
+
+Plays headless bot games (balloonPop.Simulation) for every combination of
+the given parameter values and bot models, on all cores. Each finished
+configuration is appended to a JSON lines file as soon as it is done, and a
+rerun with the same file skips configurations already in it, so an
+interrupted sweep picks up where it stopped.
+
+    python sweep.py --min-speed 1,2,3 --max-speed 4,5,6 --speed-increase 0.5,1,1.5
+    python sweep.py --balloon-count 10,20,30 --target-increase 3,5,8 --bot casual,expert
+    python sweep.py --out sweep.jsonl --sort pop_rate --limit 20   # summary only, if done
+"""
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse
+import itertools
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import balloonPop as bp
+
+# Tunable parameters and their current in-game values (medium difficulty)
+PARAMETERS = {
+    "min_speed": bp.DIFFICULTIES["medium"]["min_speed"],
+    "max_speed": bp.DIFFICULTIES["medium"]["max_speed"],
+    "speed_increase": bp.DIFFICULTIES["medium"]["speed_increase"],
+    "balloon_count": 20,
+    "target_balloons": 10,
+    "target_increase": 5,
+}
+
+# Player models: (clicks per second, accuracy). Any other model can be given
+# on the command line as CPS:ACCURACY, e.g. 5:0.8.
+BOTS = {
+    "casual": (2, 0.7),
+    "average": (4, 0.9),
+    "expert": (7, 0.97),
+}
+SORT_KEYS = ("level", "pop_rate", "escaped")
+
+
+def bot_model(name):
+    if name in BOTS:
+        return BOTS[name]
+    clicks_per_second, accuracy = name.split(":")
+    return float(clicks_per_second), float(accuracy)
+
+def trial_key(config, bot, seeds):
+    return json.dumps([config, bot, seeds], sort_keys=True)
+
+def run_trial(config, bot, seeds):
+    # One configuration and bot, played once per seed; runs in a worker process
+    clicks_per_second, accuracy = bot_model(bot)
+    games = [bp.Simulation(seed=seed, clicks=bp.click_bot(clicks_per_second, accuracy, seed=seed),
+                           tuning=config).run()
+             for seed in range(seeds)]
+    seconds = sum(game["frames"] for game in games) / 60
+    # Escapes per level, averaged over the games that reached the level
+    levels = max(len(game["escaped_by_level"]) for game in games)
+    escaped_by_level = []
+    for level in range(levels):
+        counts = [game["escaped_by_level"][level] for game in games if len(game["escaped_by_level"]) > level]
+        escaped_by_level.append(sum(counts) / len(counts))
+    return {
+        "config": config,
+        "bot": bot,
+        "seeds": seeds,
+        "pop_rate": sum(game["score"] for game in games) / seconds,
+        "level": sum(game["level"] for game in games) / seeds,
+        "max_level": max(game["level"] for game in games),
+        "escaped": sum(game["escaped"] for game in games) / seeds,
+        "escaped_by_level": escaped_by_level,
+    }
+
+def load_results(path):
+    # Results of an earlier (possibly interrupted) run, and whether its last
+    # line was torn; a torn line is ignored
+    results = {}
+    line = "\n"
+    try:
+        with open(path) as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                results[trial_key(record["config"], record["bot"], record["seeds"])] = record
+    except FileNotFoundError:
+        pass
+    return results, not line.endswith("\n")
+
+def parse_values(text):
+    return [float(value) if "." in value else int(value) for value in text.split(",")]
+
+def configurations(grid):
+    names = list(grid)
+    for values in itertools.product(*grid.values()):
+        config = dict(zip(names, values))
+        if config["min_speed"] <= config["max_speed"]:
+            yield config
+
+def print_table(records, limit):
+    varied = [name for name in PARAMETERS if len({record["config"][name] for record in records}) > 1]
+    print("".join(f"{name:>17}" for name in varied)
+          + f"{'bot':>10}{'pop/s':>8}{'level':>7}{'max':>5}{'escaped':>9}  escaped per level")
+    for record in records[:limit]:
+        row = "".join(f"{record['config'][name]:>17}" for name in varied)
+        row += (f"{record['bot']:>10}{record['pop_rate']:>8.2f}{record['level']:>7.2f}"
+                f"{record['max_level']:>5}{record['escaped']:>9.1f}  ")
+        row += " ".join(f"{count:.0f}" for count in record["escaped_by_level"])
+        print(row)
+    if len(records) > limit:
+        print(f"... {len(records) - limit} more")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Balloon Pop difficulty parameter sweep")
+    for name, default in PARAMETERS.items():
+        parser.add_argument("--" + name.replace("_", "-"), type=parse_values, default=[default],
+                            metavar="VALUES", help=f"comma-separated values to try (default: {default})")
+    parser.add_argument("--bot", default="average",
+                        help=f"comma-separated player models: {', '.join(BOTS)} or CPS:ACCURACY (default: average)")
+    parser.add_argument("--seeds", type=int, default=3, help="games per configuration and bot")
+    parser.add_argument("--workers", type=int, help="worker processes (default: all cores)")
+    parser.add_argument("--out", default="sweep.jsonl", help="JSON lines results file; reruns resume from it")
+    parser.add_argument("--sort", choices=SORT_KEYS, default="level", help="summary table order (descending)")
+    parser.add_argument("--limit", type=int, default=40, help="summary table rows")
+    args = parser.parse_args(argv)
+
+    grid = {name: getattr(args, name) for name in PARAMETERS}
+    bots = args.bot.split(",")
+    for bot in bots:
+        bot_model(bot)  # Fail now rather than in every worker
+    trials = [(config, bot) for config in configurations(grid) for bot in bots]
+    done, torn = load_results(args.out)
+    pending = [(config, bot) for config, bot in trials if trial_key(config, bot, args.seeds) not in done]
+    print(f"{len(trials)} configurations, {len(trials) - len(pending)} already in {args.out}", file=sys.stderr)
+
+    started = time.perf_counter()
+    if pending:
+        with open(args.out, "a") as file:
+            if torn:
+                file.write("\n")
+            with ProcessPoolExecutor(args.workers) as pool:
+                futures = [pool.submit(run_trial, config, bot, args.seeds) for config, bot in pending]
+                try:
+                    for finished, future in enumerate(as_completed(futures), 1):
+                        record = future.result()
+                        file.write(json.dumps(record) + "\n")
+                        file.flush()
+                        done[trial_key(record["config"], record["bot"], record["seeds"])] = record
+                        if finished % 100 == 0 or finished == len(pending):
+                            elapsed = time.perf_counter() - started
+                            print(f"{finished}/{len(pending)} done, {elapsed:.0f}s", file=sys.stderr)
+                except KeyboardInterrupt:
+                    pool.shutdown(cancel_futures=True)
+                    print(f"Interrupted; rerun with --out {args.out} to resume", file=sys.stderr)
+                    return 1
+
+    records = [done[trial_key(config, bot, args.seeds)] for config, bot in trials]
+    records.sort(key=lambda record: record[args.sort], reverse=True)
+    print_table(records, args.limit)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())